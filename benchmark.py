@@ -0,0 +1,424 @@
+import os
+import anthropic
+import argparse
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import random
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import fake_server
+import guide
+
+# End-to-end benchmark of the analysis pipeline: generates a synthetic project,
+# runs analyze_project + generate_developer_guide against the fake server, a
+# recorded cassette or the real API, and prints a JSON report (wall time,
+# per-call latency percentiles, walk time, findings I/O time, peak RSS) that can
+# be compared across commits:
+#
+#   python benchmark.py --files 500 --depth 3 --latency-mean 0.2 --workers 8 --output before.json
+#   python benchmark.py --backend record --cassette run.jsonl      # real API, saves every response
+#   python benchmark.py --backend replay --cassette run.jsonl      # same responses, no tokens
+
+# Shape of the synthetic project
+DEFAULT_FILES = 200
+DEFAULT_DEPTH = 3
+DEFAULT_FANOUT = 3
+DEFAULT_MEAN_SIZE = 4000  # bytes
+SIZE_DISTRIBUTIONS = ['fixed', 'uniform', 'lognormal']
+
+BACKENDS = ['fake', 'record', 'replay']
+
+# Analyzer methods whose time counts as findings I/O
+FINDINGS_IO_METHODS = ['_write_findings', '_append_to_journal', '_read_findings', '_append_to_summaries']
+
+def generate_tree(root, files=DEFAULT_FILES, depth=DEFAULT_DEPTH, fanout=DEFAULT_FANOUT,
+                  size_distribution='lognormal', mean_size=DEFAULT_MEAN_SIZE, seed=0):
+    """Create a deterministic synthetic Python project under root.
+
+    The tree has `depth` levels of `fanout` packages each; `files` modules are
+    spread over all of its directories, with sizes drawn from
+    size_distribution around mean_size bytes.
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    directories = ['.']
+    frontier = ['.']
+    for _ in range(depth):
+        next_frontier = []
+        for parent in frontier:
+            for index in range(fanout):
+                rel_path = f"pkg{index}" if parent == '.' else f"{parent}/pkg{index}"
+                directories.append(rel_path)
+                next_frontier.append(rel_path)
+        frontier = next_frontier
+
+    for rel_path in directories:
+        (root / rel_path).mkdir(parents=True, exist_ok=True)
+    for index in range(files):
+        if size_distribution == 'uniform':
+            size = rng.randint(1, 2 * mean_size)
+        elif size_distribution == 'lognormal':
+            size = int(rng.lognormvariate(math.log(mean_size) - 0.5, 1.0))
+        else:
+            size = mean_size
+        lines = [f'"""Synthetic module {index}"""']
+        function = 0
+        while sum(len(line) + 1 for line in lines) < size:
+            lines.append(f"def function_{index}_{function}(value):\n    return value * {function} + {index}\n")
+            function += 1
+        path = root / directories[rng.randrange(len(directories))] / f"module_{index}.py"
+        path.write_text('\n'.join(lines) + '\n', encoding='utf-8')
+    return root
+
+def percentile(values, p):
+    """Nearest-rank percentile of values (None when empty)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def request_key(request, project_dir):
+    """Stable identity of a messages request, used to match cassette entries.
+
+    The project location is masked so that a synthetic project generated in a
+    fresh temporary directory still matches its recording, and the client
+    timeout is not part of the request.
+    """
+    request = {key: value for key, value in request.items() if key != 'timeout'}
+    text = json.dumps(request, sort_keys=True).replace(str(project_dir), '<project>')
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class ObservedStream:
+    """Sync or async context manager around a messages.stream() manager.
+
+    on_end(observed, failed) is called once the reply is complete or failed;
+    observed.start is when the request was sent and observed.stream the
+    entered stream.
+    """
+
+    def __init__(self, manager, on_end):
+        self.manager = manager
+        self.on_end = on_end
+        self.start = None
+        self.stream = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        try:
+            self.stream = self.manager.__enter__()
+        except Exception:
+            self.on_end(self, True)
+            raise
+        return self.stream
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            return self.manager.__exit__(exc_type, exc, tb)
+        finally:
+            self.on_end(self, exc_type is not None)
+
+    async def __aenter__(self):
+        self.start = time.perf_counter()
+        try:
+            self.stream = await self.manager.__aenter__()
+        except Exception:
+            self.on_end(self, True)
+            raise
+        return self.stream
+
+    async def __aexit__(self, exc_type, exc, tb):
+        try:
+            return await self.manager.__aexit__(exc_type, exc, tb)
+        finally:
+            self.on_end(self, exc_type is not None)
+
+class TimingClient:
+    """LLMClient wrapper that records the latency of every streamed reply (sync or async)"""
+
+    def __init__(self, inner):
+        self.inner = inner
+        self.beta = getattr(inner, 'beta', None)
+        self.messages = SimpleNamespace(stream=self._stream)
+        self.latencies = []
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def _record(self, observed, failed):
+        with self._lock:
+            self.latencies.append(time.perf_counter() - observed.start)
+            self.errors += failed
+
+    def _stream(self, **request):
+        return ObservedStream(self.inner.messages.stream(**request), self._record)
+
+class RecordingClient:
+    """LLMClient wrapper that appends every completed reply to a JSONL cassette"""
+
+    def __init__(self, inner, cassette_path, project_dir):
+        self.inner = inner
+        self.project_dir = project_dir
+        self.beta = getattr(inner, 'beta', None)
+        self.messages = SimpleNamespace(stream=self._stream)
+        self.cassette_path = Path(cassette_path)
+        self._lock = threading.Lock()
+
+    def _save(self, request, observed, failed):
+        if failed:
+            return
+        entry = {'key': request_key(request, self.project_dir), 'latency': time.perf_counter() - observed.start,
+                 'headers': dict(observed.stream.response.headers),
+                 'message': observed.stream.current_message_snapshot.model_dump(mode='json')}
+        with self._lock, open(self.cassette_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def _stream(self, **request):
+        return ObservedStream(self.inner.messages.stream(**request),
+                              lambda observed, failed: self._save(request, observed, failed))
+
+class ReplayStream:
+    """Recorded reply served like the stream of messages.stream(), text in one delta"""
+
+    def __init__(self, entry, delay):
+        self.message = anthropic.types.Message.model_validate(entry['message'])
+        self.response = SimpleNamespace(headers=entry['headers'])
+        self.delay = delay
+
+    def __enter__(self):
+        time.sleep(self.delay)
+        self.text_stream = iter([self.message.content[0].text])
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+    def get_final_message(self):
+        return self.message
+
+class AsyncReplayStream(ReplayStream):
+    """ReplayStream for AsyncProjectAnalyzer"""
+
+    async def __aenter__(self):
+        await asyncio.sleep(self.delay)
+        self.text_stream = self._text()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return None
+
+    async def _text(self):
+        yield self.message.content[0].text
+
+    async def get_final_message(self):
+        return self.message
+
+class ReplayClient:
+    """LLMClient that answers from a cassette written by RecordingClient.
+
+    Recorded latencies are replayed multiplied by speed (0 answers at once).
+    A request missing from the cassette fails, since the run diverged from the
+    recording.
+    """
+
+    def __init__(self, cassette_path, project_dir, speed=1.0, asynchronous=False):
+        self.project_dir = project_dir
+        self.entries = {}
+        with open(cassette_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                entry = json.loads(line)
+                self.entries[entry['key']] = entry
+        self.speed = speed
+        self.stream_class = AsyncReplayStream if asynchronous else ReplayStream
+        self.messages = SimpleNamespace(stream=self._stream)
+
+    def _stream(self, **request):
+        entry = self.entries.get(request_key(request, self.project_dir))
+        if entry is None:
+            raise KeyError("Request not found in the cassette; record it again for this project and settings")
+        return self.stream_class(entry, entry['latency'] * self.speed)
+
+class Stopwatch:
+    """Accumulated wall time of instrumented methods"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def wrap(self, obj, name):
+        method = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.seconds += time.perf_counter() - start
+        setattr(obj, name, timed)
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KiB elsewhere
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=Path(__file__).parent,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def create_client(args, project_dir, server_url):
+    """Client of the chosen backend, wrapped to time every call"""
+    client_class = anthropic.AsyncAnthropic if args.use_async else anthropic.Anthropic
+    if args.backend == 'replay':
+        client = ReplayClient(args.cassette, project_dir, speed=args.replay_speed, asynchronous=args.use_async)
+    elif args.backend == 'record':
+        client = RecordingClient(client_class(max_retries=0), args.cassette, project_dir)
+    else:
+        client = client_class(base_url=server_url, api_key='fake', max_retries=0)
+    return TimingClient(client)
+
+async def run_async_phases(analyzer):
+    """Run both phases of an AsyncProjectAnalyzer; returns when the analysis ended"""
+    await analyzer.analyze_project()
+    analyzed = time.perf_counter()
+    await analyzer.generate_developer_guide()
+    return analyzed
+
+def run_once(project_dir, args, server_url):
+    """One cold run of both phases; returns its measurements"""
+    with tempfile.TemporaryDirectory(prefix='guide-benchmark-') as output_dir:
+        client = create_client(args, project_dir, server_url)
+        options = dict(max_workers=args.workers, client=client, output_dir=output_dir, journal=args.journal,
+                       stream_idle_timeout=args.stream_idle_timeout,
+                       cache=guide.SummaryCache(Path(output_dir) / 'cache'))
+        if args.use_async:
+            analyzer = guide.AsyncProjectAnalyzer(project_dir, **options)
+        else:
+            analyzer = guide.ProjectAnalyzer(project_dir, **options)
+        findings_io = Stopwatch()
+        for name in FINDINGS_IO_METHODS:
+            findings_io.wrap(analyzer, name)
+
+        try:
+            start = time.perf_counter()
+            analyzer._scan()
+            walk_seconds = time.perf_counter() - start
+            if args.use_async:
+                # Both phases share one event loop, which the async HTTP client is bound to
+                analyzed = asyncio.run(run_async_phases(analyzer))
+            else:
+                analyzer.analyze_project()
+                analyzed = time.perf_counter()
+                analyzer.generate_developer_guide()
+            end = time.perf_counter()
+        finally:
+            # Flush now: the output directory is gone by the time atexit runs
+            analyzer.flush_findings()
+
+        latencies = client.latencies
+        return {
+            'wall_seconds': round(end - start, 3),
+            'analyze_seconds': round(analyzed - start, 3),
+            'guide_seconds': round(end - analyzed, 3),
+            'walk_seconds': round(walk_seconds, 4),
+            'findings_io_seconds': round(findings_io.seconds, 4),
+            'calls': len(latencies),
+            'failed_calls': client.errors,
+            'latency_seconds': {
+                'p50': percentile(latencies, 50),
+                'p95': percentile(latencies, 95),
+                'p99': percentile(latencies, 99),
+                'mean': statistics.fmean(latencies) if latencies else None,
+            },
+            'tokens': dict(analyzer.usage),
+            'peak_rss_mb': peak_rss_mb(),
+        }
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the guide.py analysis pipeline")
+    shape = parser.add_argument_group('synthetic project')
+    shape.add_argument('--project', help="benchmark an existing project instead of a synthetic one")
+    shape.add_argument('--files', type=int, default=DEFAULT_FILES)
+    shape.add_argument('--depth', type=int, default=DEFAULT_DEPTH)
+    shape.add_argument('--fanout', type=int, default=DEFAULT_FANOUT)
+    shape.add_argument('--size-distribution', choices=SIZE_DISTRIBUTIONS, default='lognormal')
+    shape.add_argument('--mean-size', type=int, default=DEFAULT_MEAN_SIZE, help="mean file size in bytes")
+    shape.add_argument('--seed', type=int, default=0)
+
+    run = parser.add_argument_group('pipeline')
+    run.add_argument('--workers', type=int, default=8)
+    run.add_argument('--async', dest='use_async', action='store_true', help="use AsyncProjectAnalyzer")
+    run.add_argument('--journal', action='store_true', help="write findings as a JSONL journal")
+    run.add_argument('--repeat', type=int, default=1, help="number of cold runs")
+
+    backend = parser.add_argument_group('backend')
+    backend.add_argument('--backend', choices=BACKENDS, default='fake')
+    backend.add_argument('--cassette', help="JSONL cassette written by --backend record and read by replay")
+    backend.add_argument('--replay-speed', type=float, default=1.0, help="multiplier of the recorded latencies")
+    backend.add_argument('--latency', choices=fake_server.LATENCY_DISTRIBUTIONS, default='lognormal')
+    backend.add_argument('--latency-mean', type=float, default=0.05, help="mean fake response latency in seconds")
+    backend.add_argument('--output-tokens', type=int, default=200, help="length of the fake summaries")
+    backend.add_argument('--rate-limit-rate', type=float, default=0.0)
+    backend.add_argument('--overload-rate', type=float, default=0.0)
+    backend.add_argument('--tokens-per-second', type=float, help="pace of the fake streamed replies")
+    backend.add_argument('--stall-rate', type=float, default=0.0, help="probability that a fake stream stalls")
+    backend.add_argument('--stream-idle-timeout', type=float, default=guide.STREAM_IDLE_TIMEOUT)
+
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    parser.add_argument('--verbose', action='store_true', help="keep the pipeline's INFO logs")
+    args = parser.parse_args()
+    if args.backend != 'fake' and not args.cassette:
+        parser.error(f"--backend {args.backend} needs --cassette")
+    return args
+
+def main():
+    args = parse_args()
+    if not args.verbose:
+        logging.getLogger().setLevel(logging.WARNING)
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    server = server_url = None
+    if args.backend == 'fake':
+        server, server_url = fake_server.serve_in_background(
+            latency=args.latency, latency_mean=args.latency_mean, output_tokens=args.output_tokens,
+            rate_limit_rate=args.rate_limit_rate, overload_rate=args.overload_rate, retry_after=0.1,
+            tokens_per_second=args.tokens_per_second, stall_rate=args.stall_rate, seed=args.seed)
+    if args.backend == 'record' and os.path.exists(args.cassette):
+        os.remove(args.cassette)
+
+    with tempfile.TemporaryDirectory(prefix='guide-project-') as generated:
+        # A fixed directory name keeps the project name in the prompts stable across runs
+        project_dir = args.project or generate_tree(Path(generated) / 'project', args.files, args.depth, args.fanout,
+                                                    args.size_distribution, args.mean_size, args.seed)
+        runs = [run_once(project_dir, args, server_url) for _ in range(args.repeat)]
+    if server is not None:
+        server.shutdown()
+
+    report = {
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'config': {key: value for key, value in vars(args).items() if key not in ('output', 'verbose')},
+        'median_wall_seconds': round(statistics.median(run['wall_seconds'] for run in runs), 3),
+        'runs': runs,
+    }
+    output = json.dumps(report, indent=2)
+    if args.output:
+        Path(args.output).write_text(output + '\n', encoding='utf-8')
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
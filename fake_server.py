@@ -0,0 +1,439 @@
+import argparse
+import hashlib
+import itertools
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Local stand-in for the Anthropic Messages and Message Batches APIs. Every
+# request is answered with a deterministic summary derived from its prompt, so
+# guide.py can run end to end without network access or tokens, and the
+# pipeline's own overhead and scaling can be measured offline:
+#
+#   python fake_server.py --port 8765 --latency lognormal --latency-mean 2 --rate-limit-rate 0.05
+#   ANTHROPIC_BASE_URL=http://127.0.0.1:8765 ANTHROPIC_API_KEY=fake python guide.py
+#
+# Latency, response length, streaming speed and 429/529 or stalled-stream
+# injection are configurable; all random choices come from one seeded
+# generator. GET /stats returns request counters.
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 8765
+
+# Seconds a message batch stays in_progress before its results are available
+DEFAULT_BATCH_DELAY = 1.0
+
+# Response latency distributions: every sample has the configured mean
+LATENCY_DISTRIBUTIONS = ['fixed', 'uniform', 'exponential', 'lognormal']
+
+# Rough characters per token used for the reported usage
+CHARS_PER_TOKEN = 4
+
+# Characters per text delta of a streamed reply
+STREAM_CHUNK_CHARS = 64
+
+# Files of a packed prompt, each answered with a summary block of its own
+PACKED_FILE_PATTERN = re.compile(r'<file path="([^"]*)">\n(.*?)\n</file>', re.DOTALL)
+
+# Seconds an injected stalled stream stays silent before the server drops it
+DEFAULT_STALL_SECONDS = 300.0
+
+def _now():
+    return datetime.now(timezone.utc)
+
+def _timestamp(moment):
+    return moment.isoformat().replace('+00:00', 'Z') if moment else None
+
+class FakeAnthropic:
+    """State and responses of the stand-in API (thread safe).
+
+    latency picks the distribution of the response delay (latency_mean seconds
+    on average; latency_sigma shapes lognormal). output_tokens pads every
+    summary to about that many tokens. rate_limit_rate and overload_rate are
+    the probabilities of answering 429 or 529, and requests_per_minute
+    enforces a sliding-window limit reported in anthropic-ratelimit-* headers.
+    Streamed replies start after the latency and send their text at
+    tokens_per_second (unpaced when None); stall_rate is the probability
+    that a stream goes silent after its first delta for stall_seconds.
+    batch_error_rate is the probability that a batch request ends errored.
+    """
+
+    def __init__(self, batch_delay=DEFAULT_BATCH_DELAY, latency='fixed', latency_mean=0.0, latency_sigma=0.5,
+                 output_tokens=None, rate_limit_rate=0.0, overload_rate=0.0, requests_per_minute=None,
+                 retry_after=1.0, tokens_per_second=None, stall_rate=0.0, stall_seconds=DEFAULT_STALL_SECONDS,
+                 batch_error_rate=0.0, seed=0):
+        if latency not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(f"Unknown latency distribution {latency!r}, expected one of {LATENCY_DISTRIBUTIONS}")
+        self.batch_delay = batch_delay
+        self.latency = latency
+        self.latency_mean = latency_mean
+        self.latency_sigma = latency_sigma
+        self.output_tokens = output_tokens
+        self.rate_limit_rate = rate_limit_rate
+        self.overload_rate = overload_rate
+        self.requests_per_minute = requests_per_minute
+        self.retry_after = retry_after
+        self.tokens_per_second = tokens_per_second
+        self.stall_rate = stall_rate
+        self.stall_seconds = stall_seconds
+        self.batch_error_rate = batch_error_rate
+        self.batches = {}
+        self.stats = {'messages': 0, 'rate_limited': 0, 'overloaded': 0, 'stalled': 0, 'batches': 0,
+                      'input_tokens': 0, 'output_tokens': 0}
+        self._random = random.Random(seed)
+        self._window = deque()  # start times of the requests admitted in the last minute
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def snapshot(self):
+        """Copy of the request counters"""
+        with self._lock:
+            return dict(self.stats)
+
+    def sample_latency(self):
+        """Seconds to wait before answering, drawn from the configured distribution"""
+        mean = self.latency_mean
+        if mean <= 0:
+            return 0.0
+        with self._lock:
+            if self.latency == 'uniform':
+                return self._random.uniform(0, 2 * mean)
+            if self.latency == 'exponential':
+                return self._random.expovariate(1 / mean)
+            if self.latency == 'lognormal':
+                sigma = self.latency_sigma
+                return self._random.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)
+        return mean
+
+    def sample_stall(self):
+        """Whether the next stream should stall"""
+        if self.stall_rate <= 0:
+            return False
+        with self._lock:
+            stalled = self._random.random() < self.stall_rate
+            self.stats['stalled'] += stalled
+            return stalled
+
+    def admit(self):
+        """(status, headers) of a Messages request: 200, or an injected or enforced 429/529"""
+        with self._lock:
+            now = time.monotonic()
+            while self._window and now - self._window[0] >= 60:
+                self._window.popleft()
+            if self.requests_per_minute and len(self._window) >= self.requests_per_minute:
+                self.stats['rate_limited'] += 1
+                return 429, {'retry-after': f"{max(60 - (now - self._window[0]), 0.1):.1f}"}
+            draw = self._random.random()
+            if draw < self.rate_limit_rate:
+                self.stats['rate_limited'] += 1
+                return 429, {'retry-after': f"{self.retry_after:.1f}"}
+            if draw < self.rate_limit_rate + self.overload_rate:
+                self.stats['overloaded'] += 1
+                return 529, {}
+            self._window.append(now)
+            self.stats['messages'] += 1
+            headers = {}
+            if self.requests_per_minute:
+                reset = _now() + timedelta(seconds=60 - (now - self._window[0]))
+                headers = {'anthropic-ratelimit-requests-limit': str(self.requests_per_minute),
+                           'anthropic-ratelimit-requests-remaining': str(self.requests_per_minute - len(self._window)),
+                           'anthropic-ratelimit-requests-reset': _timestamp(reset)}
+            return 200, headers
+
+    def message(self, params):
+        """Messages API response: a summary that only depends on the prompt"""
+        prompt = json.dumps([params.get('system'), params.get('messages')], sort_keys=True)
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        max_tokens = params.get('max_tokens')
+        packed = PACKED_FILE_PATTERN.findall(self._last_text(params))
+        if packed:
+            # Packed files: one block per file, cut off like a real reply past max_tokens
+            text = '\n\n'.join(f'<file path="{path}">{self._summary(content, None)}</file>'
+                                 for path, content in packed)
+            if max_tokens:
+                text = text[:max_tokens * CHARS_PER_TOKEN]
+        else:
+            text = self._summary(prompt, max_tokens)
+        with self._lock:
+            self.stats['input_tokens'] += len(prompt) // CHARS_PER_TOKEN + 1
+            self.stats['output_tokens'] += len(text) // CHARS_PER_TOKEN + 1
+        return {
+            'id': f"msg_{digest[:24]}",
+            'type': 'message',
+            'role': 'assistant',
+            'model': params.get('model'),
+            'content': [{'type': 'text', 'text': text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': {'input_tokens': len(prompt) // CHARS_PER_TOKEN + 1,
+                      'output_tokens': len(text) // CHARS_PER_TOKEN + 1},
+        }
+
+    @staticmethod
+    def _last_text(params):
+        """Text of the last content block of the prompt, where the files of a request are"""
+        content = (params.get('messages') or [{}])[-1].get('content')
+        if isinstance(content, list):
+            return content[-1].get('text', '') if content else ''
+        return content or ''
+
+    def _summary(self, prompt, max_tokens):
+        """Deterministic summary of prompt, padded to output_tokens (and never past max_tokens)"""
+        digest = hashlib.sha256(prompt.encode('utf-8')).hexdigest()
+        text = f"Resumo {digest[:12]}"
+        if self.output_tokens:
+            tokens = min(self.output_tokens, max_tokens or self.output_tokens)
+            filler = ' '.join(digest[i % 56:i % 56 + 8] for i in range(tokens))
+            text = f"{text} {filler}"[:tokens * CHARS_PER_TOKEN]
+        return text
+
+    def create_batch(self, body):
+        with self._lock:
+            batch_id = f"msgbatch_{next(self._ids):06d}"
+            errored = {request['custom_id'] for request in body['requests']
+                       if self._random.random() < self.batch_error_rate}
+            self.batches[batch_id] = {'requests': body['requests'], 'created_at': _now(), 'canceled': False,
+                                      'errored': errored}
+            self.stats['batches'] += 1
+        logging.info(f"Created batch {batch_id} with {len(body['requests'])} requests")
+        return batch_id
+
+    def _ended_at(self, batch):
+        if batch['canceled']:
+            return batch['canceled']
+        return batch['created_at'] + timedelta(seconds=self.batch_delay)
+
+    def batch(self, batch_id, base_url):
+        """Message batch object; the batch ends batch_delay seconds after it was created"""
+        batch = self.batches[batch_id]
+        ended_at = self._ended_at(batch)
+        ended = _now() >= ended_at
+        total = len(batch['requests'])
+        counts = {'processing': 0 if ended else total, 'succeeded': 0, 'errored': 0,
+                  'canceled': 0, 'expired': 0}
+        if ended and batch['canceled']:
+            counts['canceled'] = total
+        elif ended:
+            counts['errored'] = len(batch['errored'])
+            counts['succeeded'] = total - counts['errored']
+        return {
+            'id': batch_id,
+            'type': 'message_batch',
+            'processing_status': 'ended' if ended else 'in_progress',
+            'request_counts': counts,
+            'created_at': _timestamp(batch['created_at']),
+            'expires_at': _timestamp(batch['created_at'] + timedelta(hours=24)),
+            'ended_at': _timestamp(ended_at) if ended else None,
+            'cancel_initiated_at': _timestamp(batch['canceled']) if batch['canceled'] else None,
+            'archived_at': None,
+            'results_url': f"{base_url}/v1/messages/batches/{batch_id}/results" if ended else None,
+        }
+
+    def cancel_batch(self, batch_id):
+        with self._lock:
+            batch = self.batches[batch_id]
+            if not batch['canceled'] and _now() < self._ended_at(batch):
+                batch['canceled'] = _now()
+
+    def batch_results(self, batch_id):
+        """JSONL lines of the results of an ended batch"""
+        batch = self.batches[batch_id]
+        for request in batch['requests']:
+            if batch['canceled']:
+                result = {'type': 'canceled'}
+            elif request['custom_id'] in batch['errored']:
+                result = {'type': 'errored', 'error': {'type': 'error', 'error': {
+                    'type': 'api_error', 'message': "Request failed (injected by the fake server)"}}}
+            else:
+                result = {'type': 'succeeded', 'message': self.message(request['params'])}
+            yield json.dumps({'custom_id': request['custom_id'], 'result': result})
+
+class FakeAnthropicHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    @property
+    def fake(self):
+        return self.server.fake
+
+    @property
+    def base_url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def log_message(self, format, *args):
+        logging.debug(f"{self.address_string()} - {format % args}")
+
+    def _read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def _send(self, status, body, content_type='application/json', headers=None):
+        payload = body.encode('utf-8') if isinstance(body, str) else json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _send_error(self, status, error_type, message, headers=None):
+        self._send(status, {'type': 'error', 'error': {'type': error_type, 'message': message}}, headers=headers)
+
+    def _send_event(self, data):
+        """Write one server-sent event as an HTTP chunk"""
+        payload = f"event: {data['type']}\ndata: {json.dumps(data)}\n\n".encode('utf-8')
+        self.wfile.write(f"{len(payload):X}\r\n".encode('ascii') + payload + b"\r\n")
+        self.wfile.flush()
+
+    def _send_stream(self, message, headers):
+        """Send a message as the event stream of a streamed Messages request"""
+        self.send_response(200)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        text = message['content'][0]['text']
+        usage = message['usage']
+        stall = self.fake.sample_stall()
+        try:
+            self._send_event({'type': 'message_start', 'message': dict(
+                message, content=[], stop_reason=None, usage=dict(usage, output_tokens=1))})
+            self._send_event({'type': 'content_block_start', 'index': 0, 'content_block': {'type': 'text', 'text': ''}})
+            for offset in range(0, len(text), STREAM_CHUNK_CHARS):
+                chunk = text[offset:offset + STREAM_CHUNK_CHARS]
+                self._send_event({'type': 'content_block_delta', 'index': 0,
+                                  'delta': {'type': 'text_delta', 'text': chunk}})
+                if stall:
+                    # Go silent, then drop the connection without finishing the stream
+                    time.sleep(self.fake.stall_seconds)
+                    self.close_connection = True
+                    return
+                if self.fake.tokens_per_second:
+                    time.sleep(len(chunk) / CHARS_PER_TOKEN / self.fake.tokens_per_second)
+            self._send_event({'type': 'content_block_stop', 'index': 0})
+            self._send_event({'type': 'message_delta', 'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+                              'usage': {'output_tokens': usage['output_tokens']}})
+            self._send_event({'type': 'message_stop'})
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client gave up on the stream
+            self.close_connection = True
+
+    def _send_message(self, body):
+        time.sleep(self.fake.sample_latency())
+        status, headers = self.fake.admit()
+        if status == 429:
+            self._send_error(429, 'rate_limit_error', "Rate limited by the fake server", headers)
+        elif status == 529:
+            self._send_error(529, 'overloaded_error', "Overloaded (injected by the fake server)", headers)
+        elif body.get('stream'):
+            self._send_stream(self.fake.message(body), headers)
+        else:
+            self._send(200, self.fake.message(body), headers=headers)
+
+    def _route(self):
+        """Path segments after /v1/messages, without the query string"""
+        path = self.path.split('?', 1)[0].rstrip('/')
+        if path != '/v1/messages' and not path.startswith('/v1/messages/'):
+            return None
+        return path[len('/v1/messages'):].strip('/').split('/') if path != '/v1/messages' else []
+
+    def do_POST(self):
+        route = self._route()
+        body = self._read_body()
+        if route == []:
+            self._send_message(body)
+        elif route == ['batches']:
+            batch_id = self.fake.create_batch(body)
+            self._send(200, self.fake.batch(batch_id, self.base_url))
+        elif route is not None and len(route) == 3 and route[0] == 'batches' and route[2] == 'cancel':
+            if route[1] not in self.fake.batches:
+                return self._send_error(404, 'not_found_error', f"No batch {route[1]}")
+            self.fake.cancel_batch(route[1])
+            self._send(200, self.fake.batch(route[1], self.base_url))
+        else:
+            self._send_error(404, 'not_found_error', f"No route for POST {self.path}")
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] == '/stats':
+            return self._send(200, self.fake.snapshot())
+        route = self._route()
+        if route is None or len(route) not in (2, 3) or route[0] != 'batches':
+            return self._send_error(404, 'not_found_error', f"No route for GET {self.path}")
+        batch_id = route[1]
+        if batch_id not in self.fake.batches:
+            return self._send_error(404, 'not_found_error', f"No batch {batch_id}")
+        if len(route) == 2:
+            self._send(200, self.fake.batch(batch_id, self.base_url))
+        elif route[2] == 'results':
+            if self.fake.batch(batch_id, self.base_url)['processing_status'] != 'ended':
+                return self._send_error(400, 'invalid_request_error', f"Batch {batch_id} has not ended")
+            self._send(200, '\n'.join(self.fake.batch_results(batch_id)) + '\n', 'application/binary')
+        else:
+            self._send_error(404, 'not_found_error', f"No route for GET {self.path}")
+
+def make_server(host=DEFAULT_HOST, port=DEFAULT_PORT, **options):
+    """HTTP server of the stand-in API; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), FakeAnthropicHandler)
+    server.daemon_threads = True
+    server.fake = FakeAnthropic(**options)
+    return server
+
+def serve_in_background(host=DEFAULT_HOST, port=0, **options):
+    """Start the stand-in API on a daemon thread and return (server, base_url)"""
+    server = make_server(host, port, **options)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Local stand-in for the Anthropic Messages and Message Batches APIs")
+    parser.add_argument('--host', default=DEFAULT_HOST)
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--batch-delay', type=float, default=DEFAULT_BATCH_DELAY,
+                        help="seconds a message batch stays in progress")
+    parser.add_argument('--batch-error-rate', type=float, default=0.0,
+                        help="probability that a batch request ends errored")
+    parser.add_argument('--latency', choices=LATENCY_DISTRIBUTIONS, default='fixed',
+                        help="distribution of the response latency")
+    parser.add_argument('--latency-mean', type=float, default=0.0, help="mean response latency in seconds")
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help="shape of the lognormal distribution")
+    parser.add_argument('--output-tokens', type=int, help="pad every summary to about this many tokens")
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help="probability of answering 429")
+    parser.add_argument('--overload-rate', type=float, default=0.0, help="probability of answering 529")
+    parser.add_argument('--requests-per-minute', type=int, help="sliding-window request limit")
+    parser.add_argument('--retry-after', type=float, default=1.0, help="retry-after of injected 429 responses")
+    parser.add_argument('--tokens-per-second', type=float, help="pace of the text of streamed replies")
+    parser.add_argument('--stall-rate', type=float, default=0.0,
+                        help="probability that a streamed reply stalls after its first delta")
+    parser.add_argument('--stall-seconds', type=float, default=DEFAULT_STALL_SECONDS,
+                        help="silence of a stalled stream before the connection is dropped")
+    parser.add_argument('--seed', type=int, default=0, help="seed of the latency and error injection")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    options = vars(args)
+    host, port = options.pop('host'), options.pop('port')
+    server = make_server(host, port, **options)
+    logging.info(f"Fake Anthropic API listening on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main()
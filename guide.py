@@ -1,9 +1,30 @@
 import os
 import anthropic
+import argparse
+import ast
+import asyncio
+import atexit
 import logging
 import json
+import fnmatch
+import functools
+import hashlib
+import httpx
+import itertools
+import queue
+import random
+import re
+import signal
+import statistics
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Optional, Protocol
 from pathlib import Path
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
@@ -26,33 +47,1089 @@ EXCLUSION_LIST = [
     'Dockerfile',
     'handlers/__pycache__',
     'handlers/coralReefClustering/__pycache__',
-    'handlers/disjointPathPlot/__pycache__'
+    'handlers/disjointPathPlot/__pycache__',
     'handlers/logical_adjacency/__pycache__',
     'utils/__pycache__',
     'images',
     'data'
 ]
 
+# Optional JSON config next to this script, e.g. {"exclude": ["dist", "*.min.js"]}
+CONFIG_FILE_NAME = 'guide.json'
+
+# Ignore files read from the root of the analyzed project
+IGNORE_FILE_NAMES = ['.gitignore', '.guideignore']
+
+# File types detected from names and extensions, recorded in the inventory
+FILE_TYPES = {
+    '.py': 'python', '.js': 'javascript', '.jsx': 'javascript', '.ts': 'typescript', '.tsx': 'typescript',
+    '.go': 'go', '.rs': 'rust', '.java': 'java', '.kt': 'kotlin', '.rb': 'ruby', '.php': 'php',
+    '.c': 'c', '.h': 'c', '.cpp': 'cpp', '.hpp': 'cpp', '.cs': 'csharp', '.swift': 'swift',
+    '.sh': 'shell', '.sql': 'sql', '.html': 'html', '.css': 'css', '.scss': 'css', '.vue': 'vue',
+    '.json': 'json', '.yaml': 'yaml', '.yml': 'yaml', '.toml': 'toml', '.ini': 'config', '.cfg': 'config',
+    '.md': 'markdown', '.rst': 'text', '.txt': 'text',
+    'Dockerfile': 'docker', 'Makefile': 'make',
+}
+
+# Claude request settings
+MODEL = "claude-3-7-sonnet-20250219"
+MAX_TOKENS = 8192
+TEMPERATURE = 0
+
+# Bump whenever a prompt template changes so cached summaries are not reused
+PROMPT_VERSION = 3
+
+# Size limit of the on-disk summary cache (least recently used entries are evicted first)
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024
+
+# Findings are kept in memory and written to disk after this many updates or seconds
+DEFAULT_FLUSH_EVERY = 50
+DEFAULT_FLUSH_INTERVAL = 10.0
+
+# Number of concurrent Claude requests (1 keeps the original sequential behaviour)
+DEFAULT_MAX_WORKERS = 1
+
+# Attempts per request when the API answers 429 (rate limited), 529 (overloaded) or 5xx
+MAX_ATTEMPTS = 8
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504, 529}
+
+# Replies are streamed; a stream that stays silent this many seconds is abandoned and retried
+STREAM_IDLE_TIMEOUT = 120.0
+
+# Rate limit budgets reported by the API in anthropic-ratelimit-<budget>-* headers
+RATE_LIMIT_BUDGETS = ['requests', 'input-tokens', 'output-tokens']
+
+# Input-token bucket: holds this many seconds of the ITPM budget, keeps a share of
+# it for small requests, and lets large requests ignore that share after waiting long enough
+TOKEN_BUCKET_BURST_SECONDS = 10
+TOKEN_BUCKET_SMALL_SHARE = 0.25
+TOKEN_BUCKET_MAX_WAIT = 30.0
+
+# Rough characters per token used by the local token estimator
+CHARS_PER_TOKEN = 3
+
+# Typical length of a generated summary, used to estimate the cost of pending work
+EXPECTED_SUMMARY_TOKENS = 1000
+
+# Files above CHUNK_THRESHOLD_TOKENS are split on top-level definitions into chunks of at
+# most CHUNK_MAX_TOKENS, summarized separately and merged. Past CHUNK_MIN_TOKENS a chunk also
+# ends after any definition whose content hash is a multiple of CHUNK_CUT_MODULUS, so cut
+# points depend on nearby code only; runs of lines with no boundary become line windows
+# that overlap by CHUNK_OVERLAP_LINES
+CHUNK_THRESHOLD_TOKENS = 50_000
+CHUNK_MAX_TOKENS = 20_000
+CHUNK_MIN_TOKENS = 10_000
+CHUNK_CUT_MODULUS = 4
+CHUNK_OVERLAP_LINES = 20
+
+# Pending files of at most PACK_FILE_MAX_TOKENS are packed, in walk order, into requests of
+# at most PACK_MAX_FILES files and PACK_MAX_TOKENS of content that answer with one
+# <file path="..."> block per file; the summaries share MAX_TOKENS, and files missing
+# from a reply (or cut off by it) get a request of their own
+PACK_FILE_MAX_TOKENS = 1_000
+PACK_MAX_TOKENS = 8_000
+PACK_MAX_FILES = MAX_TOKENS // EXPECTED_SUMMARY_TOKENS
+PACK_REPLY_PATTERN = re.compile(r'<file path="([^"]*)">(.*?)</file>', re.DOTALL)
+
+# Token counters reported in the usage of every response; the cache counters show
+# how much of the stable prompt prefixes was written to or served from the prompt cache
+USAGE_FIELDS = ['input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens']
+
+# MODEL prices in USD per million tokens of every usage counter; message batches cost half
+PRICE_PER_MTOK = {'input_tokens': 3.00, 'output_tokens': 15.00,
+                  'cache_creation_input_tokens': 3.75, 'cache_read_input_tokens': 0.30}
+BATCH_PRICE_FACTOR = 0.5
+
+# Entries listed per ranking in the end-of-phase metrics report
+METRICS_REPORT_TOP = 5
+
+# Input tokens the guide prompt may use (the context window minus room for the answer);
+# larger summary trees are condensed into digests by map-reduce rounds first
+GUIDE_INPUT_BUDGET = 150_000
+
+# Sections of the developer guide, each generated by its own request: title, topics to
+# cover, and the findings it is written from ('overview': project overview and root
+# directory, 'tree': every directory summary, 'setup'/'workflow'/'api': the overview
+# plus the summaries of the matching files)
+GUIDE_SECTIONS = [
+    ("Resumo Executivo", ["Objetivo do projeto", "Principais tecnologias", "Principais características"], 'overview'),
+    ("Arquitetura do Projeto", ["Visão geral de alto nível", "Componentes principais", "Padrões de design usados",
+                                "Fluxo de dados"], 'tree'),
+    ("Setup & Instalação", ["Pré-requisitos", "Configuração do ambiente", "Configuração do projeto"], 'setup'),
+    ("Organização do código", ["Estrutura de diretório", "Arquivos-chave e seus propósitos",
+                               "Módulos/pacotes importantes"], 'tree'),
+    ("Conceitos Básicos", ["Abstrações principais", "Interfaces principais", "Modelos de dados"], 'api'),
+    ("Fluxo de trabalho de desenvolvimento", ["Construção", "Teste", "Implantação"], 'workflow'),
+    ("Referência de API", ["Funções principais", "Classes importantes", "Interfaces públicas"], 'api'),
+    ("Tarefas comuns", ["Fluxos de trabalho de exemplo", "Exemplos de código", "Melhores práticas"], 'tree'),
+]
+
+# Sections written from file summaries ('setup', 'workflow', 'api') get the directory tree
+# plus at most this many matching files, the shallowest and then the largest first, so the
+# guide never condenses the whole file corpus again
+GUIDE_CONTEXT_FILES = 40
+
+# File types that document setup and the development workflow; other files are source code
+SETUP_FILE_TYPES = {'config', 'json', 'yaml', 'toml', 'docker', 'make', 'shell', 'markdown', 'text'}
+WORKFLOW_FILE_TYPES = {'config', 'json', 'yaml', 'toml', 'docker', 'make', 'shell'}
+
+# Message Batches backend: seconds between status polls, and the per-batch limits
+# (requests and request bytes, kept below the API's 256 MB)
+BATCH_POLL_INTERVAL = 30.0
+BATCH_MAX_REQUESTS = 100_000
+BATCH_MAX_BYTES = 200 * 1024 * 1024
+
+# Capacity of each queue between the walk, file-read and API stages of the async pipeline
+DEFAULT_QUEUE_SIZE = 64
+
+def content_hash(content):
+    """SHA-256 hex digest of a text or bytes payload"""
+    if isinstance(content, str):
+        content = content.encode('utf-8')
+    return hashlib.sha256(content).hexdigest()
+
+class PathMatcher:
+    """Exclusion patterns compiled for fast matching of project relative paths.
+
+    Plain names such as 'node_modules' or 'Dockerfile' match any path component
+    through a set lookup. Glob patterns without a slash ('*.min.js') are
+    matched against each component, patterns with a slash ('docs/build')
+    against the path from the project root; each kind is compiled into a
+    single regex. A check therefore costs O(path depth). Comments, blank
+    lines, trailing slashes and wildcards follow .gitignore syntax: '*' and
+    '?' stay within one component, '**/' matches zero or more directories
+    (so a leading '**/' matches at any depth) and a trailing '/**' everything
+    inside. Negated patterns ('!keep.txt') are not supported and are ignored.
+    """
+
+    GLOB_CHARS = re.compile(r'[*?\[]')
+    PATH_GLOB_TOKENS = re.compile(r'(\*\*/|/\*\*$|\*+|\?|\[[^\]/]*\])')
+
+    def __init__(self, patterns):
+        names = set()
+        component_globs = []
+        path_globs = []
+        for pattern in patterns:
+            pattern = pattern.strip()
+            if not pattern or pattern.startswith('#'):
+                continue
+            if pattern.startswith('!'):
+                logging.debug(f"Ignoring unsupported negated exclusion pattern: {pattern}")
+                continue
+            pattern = pattern.rstrip('/')
+            if '/' in pattern:
+                path_globs.append(pattern.lstrip('/'))
+            elif self.GLOB_CHARS.search(pattern):
+                component_globs.append(pattern)
+            elif pattern:
+                names.add(pattern)
+
+        self.names = frozenset(names)
+        self.component_regex = self._compile(component_globs, fnmatch.translate)
+        self.path_regex = self._compile(path_globs, self._translate_path_glob)
+
+    @staticmethod
+    def _compile(globs, translate):
+        if not globs:
+            return None
+        return re.compile('|'.join(translate(glob) for glob in globs))
+
+    @classmethod
+    def _translate_path_glob(cls, glob):
+        """Regex of a glob matched against a whole project relative path"""
+        regex = []
+        for token in cls.PATH_GLOB_TOKENS.split(glob):
+            if token == '**/':
+                regex.append('(?:.*/)?')
+            elif token == '/**':
+                regex.append('/.*')
+            elif token.startswith('*'):
+                regex.append('[^/]*')
+            elif token == '?':
+                regex.append('[^/]')
+            elif token.startswith('[') and len(token) > 2:
+                body = token[1:-1]
+                regex.append(f"[^{body[1:]}]" if body.startswith('!') else f"[{body}]")
+            else:
+                regex.append(re.escape(token))
+        return f"(?s:{''.join(regex)})\\Z"
+
+    def matches(self, rel_path):
+        """True when rel_path or one of its parent directories is excluded"""
+        prefix = ''
+        for part in Path(rel_path).parts:
+            if part in self.names:
+                return True
+            if self.component_regex is not None and self.component_regex.match(part):
+                return True
+            if self.path_regex is not None:
+                prefix = f"{prefix}/{part}" if prefix else part
+                if self.path_regex.match(prefix):
+                    return True
+        return False
+
+def read_patterns(path):
+    """Exclusion patterns of a .gitignore style file, or [] if it does not exist"""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+def walk_project(project_dir, is_excluded):
+    """Pruning top-down walk of a project built on os.scandir.
+
+    Yields (dir_path, rel_path, subdirs, files) for every directory, where
+    subdirs and files are os.DirEntry objects sorted by name so their cached
+    type and stat information can be reused. is_excluded receives project
+    relative paths; excluded directories are never entered. Symlinked
+    directories are not followed, like os.walk.
+    """
+    stack = [(str(project_dir), '.')]
+    while stack:
+        dir_path, rel_path = stack.pop()
+        subdirs = []
+        files = []
+        try:
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    entry_rel = entry.name if rel_path == '.' else f"{rel_path}/{entry.name}"
+                    if is_excluded(entry_rel):
+                        continue
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry)
+                    elif entry.is_file():
+                        files.append(entry)
+        except OSError as e:
+            logging.warning(f"Cannot read directory {dir_path}: {str(e)}")
+            continue
+
+        subdirs.sort(key=lambda entry: entry.name)
+        files.sort(key=lambda entry: entry.name)
+        yield dir_path, rel_path, subdirs, files
+        for entry in reversed(subdirs):
+            stack.append((entry.path, entry.name if rel_path == '.' else f"{rel_path}/{entry.name}"))
+
+@dataclass
+class InventoryEntry:
+    path: str                   # project relative, '/' separated
+    kind: str                   # 'file' or 'dir'
+    size: int
+    mtime_ns: int
+    inode: int
+    type: str                   # detected file type ('binary' files are not analyzed)
+    hash: Optional[str] = None  # content hash, files only
+
+def detect_file_type(name, head):
+    """File type from its name, or 'binary' when its first bytes contain NUL"""
+    if b'\0' in head:
+        return 'binary'
+    return FILE_TYPES.get(name) or FILE_TYPES.get(os.path.splitext(name)[1].lower(), 'text')
+
+class Inventory:
+    """Everything the analysis needs to know about the project tree, built in one walk.
+
+    Holds an InventoryEntry per file and directory plus the tree structure in
+    walk order. Inventories are saved next to the findings; when a previous
+    inventory is given, files whose (mtime, size) did not change keep their
+    hash and type instead of being read again.
+    """
+
+    def __init__(self, project_dir, entries, directories):
+        self.project_dir = Path(project_dir)
+        self.entries = entries          # rel_path -> InventoryEntry
+        self.directories = directories  # rel_dir -> {'subdirs': [...], 'files': [...]}, walk order
+
+    @classmethod
+    def build(cls, project_dir, is_excluded, previous=None):
+        entries = {}
+        directories = {}
+        reused = 0
+        for dir_path, rel_path, subdirs, files in walk_project(project_dir, is_excluded):
+            try:
+                stat = os.stat(dir_path)
+            except OSError as e:
+                logging.warning(f"Cannot read directory {dir_path}: {str(e)}")
+                continue
+            entries[rel_path] = InventoryEntry(rel_path, 'dir', stat.st_size, stat.st_mtime_ns, stat.st_ino, 'dir')
+            subdir_rels = [cls._join(rel_path, entry.name) for entry in subdirs]
+            file_rels = []
+            directories[rel_path] = {'subdirs': subdir_rels, 'files': file_rels}
+
+            for entry in files:
+                file_rel = cls._join(rel_path, entry.name)
+                # An unreadable file, or one deleted mid-scan, is left out instead of aborting the run
+                try:
+                    stat = entry.stat()
+                    old = previous.entries.get(file_rel) if previous is not None else None
+                    if old is not None and old.kind == 'file' and (old.mtime_ns, old.size) == (stat.st_mtime_ns, stat.st_size):
+                        file_type, file_hash = old.type, old.hash
+                        reused += 1
+                    else:
+                        file_type, file_hash = cls._hash_file(entry)
+                except OSError as e:
+                    logging.warning(f"Cannot read file {entry.path}: {str(e)}")
+                    continue
+                entries[file_rel] = InventoryEntry(file_rel, 'file', stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                                                   file_type, file_hash)
+                file_rels.append(file_rel)
+
+        # Subdirectories that could not be read have no listing of their own
+        for tree in directories.values():
+            tree['subdirs'] = [subdir for subdir in tree['subdirs'] if subdir in directories]
+        logging.info(f"Inventory: {len(directories)} directories, {len(entries) - len(directories)} files "
+                     f"({reused} unchanged since the previous inventory)")
+        return cls(project_dir, entries, directories)
+
+    @staticmethod
+    def _join(rel_dir, name):
+        return name if rel_dir == '.' else f"{rel_dir}/{name}"
+
+    @staticmethod
+    def _hash_file(entry):
+        digest = hashlib.sha256()
+        with open(entry.path, 'rb') as f:
+            head = f.read(8192)
+            digest.update(head)
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+        return detect_file_type(entry.name, head), digest.hexdigest()
+
+    def files(self, rel_dir):
+        return [self.entries[rel] for rel in self.directories[rel_dir]['files']]
+
+    def diff(self, previous):
+        """Paths added, changed and removed since a previous inventory"""
+        added = [rel for rel in self.entries if rel not in previous.entries]
+        removed = [rel for rel in previous.entries if rel not in self.entries]
+        changed = [rel for rel, entry in self.entries.items()
+                   if entry.kind == 'file' and rel in previous.entries and previous.entries[rel].hash != entry.hash]
+        return {'added': added, 'changed': changed, 'removed': removed}
+
+    def save(self, path):
+        data = {
+            'project_dir': str(self.project_dir),
+            'directories': self.directories,
+            'entries': [asdict(entry) for entry in self.entries.values()],
+        }
+        tmp_path = Path(path).with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        entries = {item['path']: InventoryEntry(**item) for item in data['entries']}
+        return cls(data['project_dir'], entries, data['directories'])
+
+def estimate_tokens(text):
+    """Fast local estimate of the number of tokens in text"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def usage_cost(usage, price_factor=1.0):
+    """USD cost of a dict of USAGE_FIELDS token counts"""
+    return sum(usage[field] * PRICE_PER_MTOK[field] for field in USAGE_FIELDS) / 1_000_000 * price_factor
+
+def definition_starts(lines, file_type):
+    """0-based indices of the lines that start a top-level definition (always including 0).
+
+    Python files are parsed; other files, or Python that does not parse, start a
+    definition at every unindented line that follows a blank line.
+    """
+    starts = {0}
+    if file_type == 'python':
+        try:
+            tree = ast.parse(''.join(lines))
+        except (SyntaxError, ValueError):
+            tree = None
+        if tree is not None:
+            for node in tree.body:
+                # Decorators belong to the definition they decorate
+                starts.add(min([node.lineno] + [d.lineno for d in getattr(node, 'decorator_list', [])]) - 1)
+            return sorted(starts)
+    for index in range(1, len(lines)):
+        if not lines[index - 1].strip() and lines[index][:1] not in ' \t\r\n})]':
+            starts.add(index)
+    return sorted(starts)
+
+def line_windows(lines, start, end, max_tokens):
+    """(first, end) line ranges of about max_tokens covering lines[start:end], overlapping by CHUNK_OVERLAP_LINES"""
+    windows = []
+    first = start
+    while True:
+        last, tokens = first, 0
+        while last < end and (last == first or tokens + estimate_tokens(lines[last]) <= max_tokens):
+            tokens += estimate_tokens(lines[last])
+            last += 1
+        windows.append((first, last))
+        if last >= end:
+            return windows
+        first = max(last - CHUNK_OVERLAP_LINES, first + 1)
+
+def split_into_chunks(content, file_type, max_tokens=CHUNK_MAX_TOKENS):
+    """Split file content into (first line, last line, text) chunks on top-level definitions"""
+    lines = content.splitlines(keepends=True)
+    starts = definition_starts(lines, file_type)
+    ranges = []
+    first, tokens = 0, 0
+    for start, end in zip(starts, starts[1:] + [len(lines)]):
+        segment = ''.join(lines[start:end])
+        size = estimate_tokens(segment)
+        if tokens and tokens + size > max_tokens:
+            ranges.append((first, start))
+            first, tokens = start, 0
+        if size > max_tokens:
+            ranges.extend(line_windows(lines, start, end, max_tokens))
+            first, tokens = end, 0
+            continue
+        tokens += size
+        if tokens >= CHUNK_MIN_TOKENS and int(content_hash(segment)[:8], 16) % CHUNK_CUT_MODULUS == 0:
+            ranges.append((first, end))
+            first, tokens = end, 0
+    if first < len(lines):
+        ranges.append((first, len(lines)))
+    return [(first + 1, end, ''.join(lines[first:end])) for first, end in ranges]
+
+def estimate_request_tokens(request):
+    """Estimated input tokens of a messages.create request (system prompt + messages)"""
+    texts = [request['system']] if isinstance(request.get('system'), str) else [
+        block['text'] for block in request.get('system', [])]
+    for message in request['messages']:
+        content = message['content']
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(block.get('text', '') for block in content)
+    return sum(estimate_tokens(text) for text in texts)
+
+class TokenBucket:
+    """Admits requests by their estimated input tokens against a tokens-per-minute budget.
+
+    The bucket refills continuously at limit/60 tokens per second and holds
+    TOKEN_BUCKET_BURST_SECONDS worth of tokens, so the budget is spent evenly
+    instead of in bursts. A request takes its full cost even when that drives
+    the level negative (a file larger than the bucket is still admitted
+    once the bucket is full). Large requests must leave a share of the
+    bucket to small ones, so a run of big files cannot starve small files;
+    after TOKEN_BUCKET_MAX_WAIT seconds they may use that share too.
+    """
+
+    def __init__(self, tokens_per_minute):
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.set_limit(tokens_per_minute)
+        self.level = self.capacity
+
+    def set_limit(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self.rate = tokens_per_minute / 60
+        self.capacity = self.rate * TOKEN_BUCKET_BURST_SECONDS
+        self.level = min(self.level, self.capacity)
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_take(self, cost, waited):
+        """Take cost tokens and return 0, or return how long to wait before trying again"""
+        now = time.monotonic()
+        self._refill(now)
+        reserve = self.capacity * TOKEN_BUCKET_SMALL_SHARE
+        large = cost > reserve and waited < TOKEN_BUCKET_MAX_WAIT
+        needed = min(cost, self.capacity - reserve) + (reserve if large else 0)
+        if self.level >= needed:
+            self.level -= cost
+            return 0
+        return (needed - self.level) / self.rate
+
+    def sync(self, remaining):
+        """Never assume more tokens than the API reports as remaining"""
+        self.level = min(self.level, remaining)
+
+class RateLimiter:
+    """Adaptive client-side limiter shared by every Claude request.
+
+    Concurrency follows AIMD: each successful request adds 1/window to the
+    concurrency window (about +1 per window of requests) and a 429/529 halves
+    it. The anthropic-ratelimit-* headers of every response track what is left
+    of the requests, input-token and output-token budgets; once one is
+    exhausted new requests wait for its reset, and retry-after pauses all of
+    them. Requests are also admitted by their estimated input tokens through
+    a TokenBucket sized from the input-tokens limit header (or the
+    input_tokens_per_minute argument until the first response arrives).
+    acquire/acquire_async block until a request may start and must be paired
+    with release.
+    """
+
+    POLL_INTERVAL = 0.05
+
+    def __init__(self, max_concurrency, input_tokens_per_minute=None):
+        self.max_concurrency = max(1, max_concurrency)
+        self.input_tokens = TokenBucket(input_tokens_per_minute) if input_tokens_per_minute else None
+        self.window = float(self.max_concurrency)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self.budgets = {}  # budget -> (remaining, reset as time.monotonic())
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self, cost, waited):
+        """Reserve a slot and return 0, or return how long to wait before trying again"""
+        with self._lock:
+            now = time.monotonic()
+            delay = self.paused_until - now
+            for remaining, reset in self.budgets.values():
+                if remaining <= 0 and reset > now:
+                    delay = max(delay, reset - now)
+            if delay > 0:
+                return delay
+            if self.in_flight >= int(self.window):
+                return self.POLL_INTERVAL
+            if self.input_tokens is not None:
+                delay = self.input_tokens.try_take(cost, waited)
+                if delay:
+                    return max(delay, self.POLL_INTERVAL)
+            self.in_flight += 1
+            return 0
+
+    def acquire(self, cost=0):
+        """Wait until a request with cost estimated input tokens may start"""
+        start = time.monotonic()
+        while True:
+            delay = self._try_acquire(cost, time.monotonic() - start)
+            if not delay:
+                return
+            time.sleep(min(delay, 1.0))
+
+    async def acquire_async(self, cost=0):
+        start = time.monotonic()
+        while True:
+            delay = self._try_acquire(cost, time.monotonic() - start)
+            if not delay:
+                return
+            await asyncio.sleep(min(delay, 1.0))
+
+    def release(self, headers=None, throttled=False):
+        """Return a slot and learn from the response headers"""
+        with self._lock:
+            self.in_flight -= 1
+            now = time.monotonic()
+            if headers is not None:
+                self._read_headers(headers, now)
+            if throttled:
+                self.throttled += 1
+                self.window = max(1.0, self.window / 2)
+                retry_after = self._retry_after(headers)
+                if retry_after is not None:
+                    self.paused_until = max(self.paused_until, now + retry_after)
+            else:
+                self.window = min(float(self.max_concurrency), self.window + 1 / self.window)
+
+    def _read_headers(self, headers, now):
+        limit = headers.get('anthropic-ratelimit-input-tokens-limit')
+        if limit is not None and limit.isdigit():
+            if self.input_tokens is None:
+                self.input_tokens = TokenBucket(int(limit))
+            elif self.input_tokens.tokens_per_minute != int(limit):
+                self.input_tokens.set_limit(int(limit))
+            remaining = headers.get('anthropic-ratelimit-input-tokens-remaining')
+            if remaining is not None and remaining.isdigit():
+                self.input_tokens.sync(int(remaining))
+
+        for budget in RATE_LIMIT_BUDGETS:
+            remaining = headers.get(f'anthropic-ratelimit-{budget}-remaining')
+            reset = headers.get(f'anthropic-ratelimit-{budget}-reset')
+            if remaining is None or reset is None:
+                continue
+            try:
+                reset_at = datetime.fromisoformat(reset.replace('Z', '+00:00'))
+                seconds = (reset_at - datetime.now(timezone.utc)).total_seconds()
+                self.budgets[budget] = (int(remaining), now + max(0.0, seconds))
+            except ValueError:
+                logging.debug(f"Ignoring malformed rate limit headers for {budget}")
+
+    @staticmethod
+    def _retry_after(headers):
+        try:
+            return float(headers.get('retry-after')) if headers is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    @staticmethod
+    def backoff(attempt):
+        """Delay before retrying a failed request that had no retry-after header"""
+        return min(60.0, 2 ** attempt) * random.uniform(0.5, 1.0)
+
+class PriorityPool:
+    """Fixed pool of worker threads that always runs the highest priority task next.
+
+    submit() returns a concurrent.futures.Future. The start and end time of
+    every task is kept in `timings` as (label, start, end) for the makespan
+    report. Leaving the context waits for all queued tasks, like
+    ThreadPoolExecutor; cancelled futures are skipped.
+    """
+
+    def __init__(self, workers):
+        self.workers = workers
+        self.timings = []
+        self._queue = queue.PriorityQueue()
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self._threads = [threading.Thread(target=self._work, daemon=True) for _ in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, priority, label, func, *args):
+        future = Future()
+        # Ties run in submission order
+        self._queue.put((-priority, next(self._counter), future, label, func, args))
+        return future
+
+    def _work(self):
+        while True:
+            _, _, future, label, func, args = self._queue.get()
+            if future is None:  # Shutdown sentinel, queued behind every real task
+                return
+            if not future.set_running_or_notify_cancel():
+                continue
+            start = time.monotonic()
+            try:
+                result = func(*args)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+            with self._lock:
+                self.timings.append((label, start, time.monotonic()))
+
+    def shutdown(self):
+        for _ in self._threads:
+            self._queue.put((float('inf'), next(self._counter), None, None, None, None))
+        for thread in self._threads:
+            thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown()
+
+class TaskGraph:
+    """Runs a DAG of tasks on a PriorityPool, starting each task the moment its dependencies finish.
+
+    add() registers a task and returns a Future for its result. The task is
+    called as func(*args, *dependency_results); a dependency that failed or
+    was skipped contributes None. Tasks listed in `after` must finish first
+    but their results are not passed. done() registers a task whose result is
+    already known (resumed or reused work), so dependents do not wait for it.
+    Leaves and reduces share the pool, ordered by priority.
+    """
+
+    def __init__(self, pool):
+        self.pool = pool
+        self._tasks = {}
+        self._lock = threading.Lock()
+        self._started = False
+
+    def add(self, key, func, args=(), deps=(), priority=0, after=()):
+        task = {'func': func, 'args': args, 'deps': list(deps), 'after': list(after), 'priority': priority,
+                'future': Future(), 'submitted': None, 'waiting': 0, 'dependents': []}
+        with self._lock:
+            self._tasks[key] = task
+            for dep in task['deps'] + task['after']:
+                if not self._tasks[dep]['future'].done():
+                    task['waiting'] += 1
+                    self._tasks[dep]['dependents'].append(key)
+            ready = self._started and task['waiting'] == 0
+        if ready:
+            self._submit(key)
+        return task['future']
+
+    def __contains__(self, key):
+        return key in self._tasks
+
+    def done(self, key, value):
+        future = resolved_future(value)
+        with self._lock:
+            self._tasks[key] = {'future': future, 'deps': [], 'after': [], 'dependents': [], 'waiting': 0,
+                                'submitted': None}
+        return future
+
+    def start(self):
+        with self._lock:
+            self._started = True
+            ready = [key for key, task in self._tasks.items()
+                     if task['waiting'] == 0 and not task['future'].done()]
+        for key in ready:
+            self._submit(key)
+
+    def _submit(self, key):
+        task = self._tasks[key]
+        results = [self._result(dep) for dep in task['deps']]
+        task['submitted'] = self.pool.submit(task['priority'], key, task['func'], *task['args'], *results)
+        task['submitted'].add_done_callback(lambda submitted: self._finished(key, submitted))
+
+    def _result(self, key):
+        future = self._tasks[key]['future']
+        if future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def _finished(self, key, submitted):
+        task = self._tasks[key]
+        if task['future'].done():
+            pass  # Already cancelled by cancel()
+        elif submitted.cancelled():
+            task['future'].cancel()
+        elif submitted.exception() is not None:
+            task['future'].set_exception(submitted.exception())
+        else:
+            task['future'].set_result(submitted.result())
+
+        ready = []
+        with self._lock:
+            for dependent in task['dependents']:
+                self._tasks[dependent]['waiting'] -= 1
+                if self._tasks[dependent]['waiting'] == 0:
+                    ready.append(dependent)
+        for dependent in ready:
+            if task['future'].cancelled():
+                self._tasks[dependent]['future'].cancel()
+                self._finished(dependent, self._tasks[dependent]['future'])
+            else:
+                self._submit(dependent)
+
+    def cancel(self):
+        """Drop every task that has not started yet"""
+        with self._lock:
+            tasks = list(self._tasks.values())
+        for task in tasks:
+            if task['submitted'] is not None:
+                task['submitted'].cancel()
+            task['future'].cancel()
+
+    def chains(self):
+        """Dependencies of every task, for schedule_report"""
+        return {key: task['deps'] + task['after'] for key, task in self._tasks.items()
+                if task['deps'] or task['after']}
+
+def schedule_report(timings, workers, chains):
+    """Compare the actual makespan of a pool run against its lower bound.
+
+    chains maps task labels to the labels they waited for; the critical
+    path is the longest dependency chain of measured durations, and
+    no schedule can beat max(total work / workers, critical path).
+    """
+    if not timings:
+        return None
+    durations = {label: end - start for label, start, end in timings}
+    makespan = max(end for _, _, end in timings) - min(start for _, start, _ in timings)
+    work = sum(durations.values())
+    finish = {}
+
+    def longest_chain(label):
+        # Longest run of measured durations ending with label; untimed tasks count as 0
+        if label not in finish:
+            waited = max((longest_chain(dependency) for dependency in chains.get(label, ())), default=0.0)
+            finish[label] = waited + durations.get(label, 0.0)
+        return finish[label]
+
+    critical_path = max(longest_chain(label) for label in durations)
+    lower_bound = max(work / workers, critical_path)
+    return {
+        'tasks': len(timings),
+        'workers': workers,
+        'makespan_seconds': round(makespan, 3),
+        'work_seconds': round(work, 3),
+        'critical_path_seconds': round(critical_path, 3),
+        'lower_bound_seconds': round(lower_bound, 3),
+        'makespan_over_lower_bound': round(makespan / lower_bound, 3) if lower_bound else None,
+    }
+
+def resolved_future(value):
+    """A concurrent.futures.Future that already holds value"""
+    future = Future()
+    future.set_result(value)
+    return future
+
+class FlushPolicy:
+    """Decides when buffered findings updates are written to disk.
+
+    Flushes after `every` updates or `interval` seconds, whichever comes
+    first; None disables that trigger. Findings are always flushed at the end
+    of a phase and at interpreter exit. Any object with a compatible
+    should_flush method can be passed to ProjectAnalyzer instead.
+    """
+
+    def __init__(self, every=DEFAULT_FLUSH_EVERY, interval=DEFAULT_FLUSH_INTERVAL):
+        self.every = every
+        self.interval = interval
+
+    def should_flush(self, pending_updates, seconds_since_flush):
+        if self.every is not None and pending_updates >= self.every:
+            return True
+        return self.interval is not None and seconds_since_flush >= self.interval
+
+class GuideWriter:
+    """Writes the guidebook to disk while its sections stream in (thread safe).
+
+    Sections are generated concurrently but written in order: the text of the
+    first unfinished section goes straight to the file (and to stdout when
+    echo is set), later sections are buffered until the ones before them are
+    finished. The guide is written to a .part file that only takes its final
+    name once every section is complete, so a failed run never leaves a
+    truncated guidebook behind.
+    """
+
+    def __init__(self, path, header, headings, echo=False):
+        self.path = Path(path)
+        self.part_path = self.path.with_name(self.path.name + '.part')
+        self.headings = headings
+        self.echo = echo
+        self.sections = [{'chunks': [], 'started': False, 'trailing': '', 'finished': False} for _ in headings]
+        self.current = 0
+        self._lock = threading.Lock()
+        self._file = open(self.part_path, 'w', encoding='utf-8')
+        self._emit(header)
+        self._open_section()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._file.close()
+        if exc_type is None:
+            self.part_path.replace(self.path)
+
+    def _emit(self, text):
+        self._file.write(text)
+        self._file.flush()
+        if self.echo:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+    def _open_section(self):
+        """Write the heading and the buffered text of the current section"""
+        self._emit(f"\n\n## {self.headings[self.current]}\n\n")
+        self._section_start = self._file.tell()
+        section = self.sections[self.current]
+        self._emit(''.join(section['chunks']))
+        section['chunks'] = []
+
+    def write(self, index, text):
+        """Append a text delta to section index; None discards its partial text before a retry"""
+        with self._lock:
+            section = self.sections[index]
+            if text is None:
+                section.update(chunks=[], started=False, trailing='')
+                if index == self.current:
+                    self._file.seek(self._section_start)
+                    self._file.truncate()
+                    if self.echo:
+                        sys.stdout.write(f"\n\n[{self.headings[index]}: resposta interrompida, reiniciando]\n\n")
+                return
+            # Strip the section body: drop leading whitespace, hold trailing whitespace back
+            if not section['started']:
+                text = text.lstrip()
+                if not text:
+                    return
+                section['started'] = True
+            body = text.rstrip()
+            if not body:
+                section['trailing'] += text
+                return
+            text, section['trailing'] = section['trailing'] + body, text[len(body):]
+            if index == self.current:
+                self._emit(text)
+            else:
+                section['chunks'].append(text)
+
+    def finish(self, index):
+        """Mark section index complete and move on to the next unfinished section"""
+        with self._lock:
+            self.sections[index]['finished'] = True
+            while self.current < len(self.sections) and self.sections[self.current]['finished']:
+                self.current += 1
+                if self.current < len(self.sections):
+                    self._open_section()
+            if self.current == len(self.sections):
+                self._emit('\n')
+
+class SummaryCache:
+    """Persistent content-addressed store of Claude summaries.
+
+    Every entry is a text file named after its key. Entries are evicted least
+    recently used first once the cache grows beyond max_bytes; the file mtime
+    records the last access so the LRU order survives between runs.
+    """
+
+    def __init__(self, cache_dir, max_bytes=DEFAULT_CACHE_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        # key -> size in bytes, least recently used first
+        self._entries = OrderedDict()
+        entries = []
+        for path in self.cache_dir.glob('*.txt'):
+            stat = path.stat()
+            entries.append((stat.st_mtime, path.stem, stat.st_size))
+        for _, key, size in sorted(entries):
+            self._entries[key] = size
+        self._size = sum(self._entries.values())
+
+    @staticmethod
+    def make_key(*parts):
+        return content_hash('\0'.join(str(part) for part in parts))
+
+    def _path(self, key):
+        return self.cache_dir / f'{key}.txt'
+
+    def __contains__(self, key):
+        """Whether key is cached, without reading it or counting a hit or miss"""
+        with self._lock:
+            return key in self._entries
+
+    def get(self, key):
+        """Return the cached value for key, or None on a miss"""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            path = self._path(key)
+            value = path.read_text(encoding='utf-8')
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        tmp_path = path.with_suffix(f'.{threading.get_ident()}.tmp')
+        tmp_path.write_text(value, encoding='utf-8')
+        os.replace(tmp_path, path)
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = path.stat().st_size
+            self._size += self._entries[key]
+            self._evict()
+
+    def _forget(self, key):
+        self._size -= self._entries.pop(key, 0)
+
+    def _evict(self):
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._size -= size
+            try:
+                self._path(key).unlink()
+            except OSError:
+                pass
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'entries': len(self._entries), 'bytes': self._size}
+
+class LLMClient(Protocol):
+    """Client interface of ProjectAnalyzer, satisfied by anthropic.Anthropic.
+
+    The analyzer only calls client.messages.stream(**request, timeout=...), a
+    context manager giving a stream with `response.headers`, a `text_stream`
+    iterator of text deltas and get_final_message() returning the Message
+    (content[0].text and usage). BatchProjectAnalyzer also uses
+    client.beta.messages.batches, and AsyncProjectAnalyzer enters the stream
+    with `async with`. Pass any such object as `client=` to run against a
+    fake or proxy.
+    """
+    messages: Any
+
 class ProjectAnalyzer:
-    def __init__(self, project_dir):
-        # Base directories
+    def __init__(self, project_dir, max_workers=DEFAULT_MAX_WORKERS, cache=None, flush_policy=None,
+                 journal=False, resume=None, rate_limiter=None, input_tokens_per_minute=None,
+                 client: Optional[LLMClient] = None, output_dir=None, stream_idle_timeout=STREAM_IDLE_TIMEOUT,
+                 echo=False, pack_file_tokens=PACK_FILE_MAX_TOKENS):
+        # Base directories; findings, summaries and guidebooks are written to output_dir
         self.project_dir = Path(project_dir)
-        self.script_dir = Path(__file__).parent
-        self.timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        self.max_workers = max(1, int(max_workers))
+        self.script_dir = Path(output_dir) if output_dir is not None else Path(__file__).parent
+        self.timestamp = resume or datetime.now().strftime("%Y%m%d_%H%M%S")
         
-        # Create output directories
+        # Create output directories (a resumed run reuses the existing ones)
         self.findings_dir = self.script_dir / 'findings' / self.timestamp
+        if resume and not self.findings_dir.is_dir():
+            raise FileNotFoundError(f"No findings to resume in {self.findings_dir}")
         self.findings_dir.mkdir(parents=True, exist_ok=True)
         
         # Set up file paths
         self.findings_path = self.findings_dir / 'findings.json'
+        self.journal_path = self.findings_dir / 'findings.jsonl'
+        self.inventory_path = self.findings_dir / 'inventory.json'
         self.initial_summaries_path = self.script_dir / f'initial-summaries_{self.timestamp}.txt'
         
-        # Initialize anthropic client
-        self.client = anthropic.Anthropic()
+        # Initialize anthropic client unless one is injected; retries are left to the shared rate limiter
+        self.client = client if client is not None else self._create_client()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter(
+            self.max_workers, input_tokens_per_minute=input_tokens_per_minute)
+        self.stream_idle_timeout = stream_idle_timeout
+
+        # Echo the guide to stdout while it is written
+        self.echo = echo
+
+        # Compiled exclusion rules
+        self.matcher = PathMatcher(self._exclusion_patterns())
+
+        # Summaries of unchanged files are reused across runs
+        self.cache = cache if cache is not None else SummaryCache(self.script_dir / 'cache')
+
+        # Small files are summarized in packs first (0 disables packing); file cache key -> summary
+        self.pack_file_tokens = pack_file_tokens
+        self.pack_results = {}
+        self.pack_keys = {}  # rel_path -> file cache key, for the files sent in a pack
+
+        # Result of the single project walk shared by every phase (see _scan)
+        self.inventory = None
+
+        # Root overview shared by the cached prefix of every file and directory prompt
+        self.project_overview = None
+
+        # Token usage of every response of this run, including prompt cache reads and writes
+        self.usage = dict.fromkeys(USAGE_FIELDS, 0)
+        self._usage_lock = threading.Lock()
+
+        # Merkle hashes of this run and findings of the previous run of the same project
+        self.merkle = {}
+        self.previous_timestamp = None
+        self.previous_findings = None
         
-        # Initialize findings file
-        self._init_findings_file()
+        # Findings live in memory and are flushed to disk according to the policy.
+        # In journal mode every update is also appended to findings.jsonl and
+        # findings.json is only rewritten when the journal is compacted.
+        self.flush_policy = flush_policy if flush_policy is not None else FlushPolicy()
+        self.journal = journal
+        self._journal_file = None
+        self._findings_lock = threading.RLock()
+        self._pending_updates = 0
+        self._last_flush = time.monotonic()
+
+        # Initialize findings file, or pick up where an interrupted run stopped
+        if resume:
+            self._load_findings_for_resume()
+        else:
+            self._init_findings_file()
+        atexit.register(self.flush_findings)
         
         logging.info(f"Initialized ProjectAnalyzer:")
         logging.info(f"- Project directory: {self.project_dir}")
@@ -60,20 +1137,114 @@ class ProjectAnalyzer:
         logging.info(f"- Findings directory: {self.findings_dir}")
         logging.info(f"- Initial summaries: {self.initial_summaries_path}")
         logging.info(f"- Findings JSON: {self.findings_path}")
+        if self.journal:
+            logging.info(f"- Findings journal: {self.journal_path}")
+        logging.info(f"- Max workers: {self.max_workers}")
+        logging.info(f"- Summary cache: {self.cache.cache_dir}")
+
+    def _create_client(self):
+        return anthropic.Anthropic(max_retries=0)
 
     def _init_findings_file(self):
         """Initialize the findings JSON file with basic structure"""
         initial_structure = {
+            'project_dir': str(self.project_dir),
             'root_summary': '',
             'directories': {},
-            'files': {}
+            'files': {},
+            'merkle': {}
         }
+        self.findings = initial_structure
         self._write_findings(initial_structure)
 
+    def _load_findings_for_resume(self):
+        """Load findings.json plus any journal entries written after it"""
+        with open(self.findings_path, 'r') as f:
+            findings = json.load(f)
+        if findings.get('project_dir', str(self.project_dir)) != str(self.project_dir):
+            raise ValueError(f"Run {self.timestamp} analyzed {findings['project_dir']}, not {self.project_dir}")
+
+        self.findings = self._replay_journal(findings)
+        # Compacted in journal mode too: new entries appended after a torn last line would
+        # join the fragment, and the next replay would stop there and drop them
+        if self.journal_path.exists():
+            self.compact_findings()
+        logging.info(f"Resuming run {self.timestamp}: {len(self.findings['files'])} files and "
+                     f"{len(self.findings['directories'])} directories already analyzed")
+
+    def install_signal_handlers(self):
+        """Flush findings before SIGINT/SIGTERM stop the run, so it can be resumed"""
+        def handle(signum, frame):
+            logging.warning(f"Received signal {signum}, saving findings before exiting")
+            self.flush_findings()
+            logging.warning(f"Continue this run with: python guide.py --resume {self.timestamp}")
+            raise KeyboardInterrupt
+
+        signal.signal(signal.SIGINT, handle)
+        signal.signal(signal.SIGTERM, handle)
+
     def _write_findings(self, data):
-        """Write or update findings JSON file"""
-        with open(self.findings_path, 'w') as f:
+        """Atomically write the findings JSON file (temp file + rename)"""
+        tmp_path = self.findings_path.with_suffix('.json.tmp')
+        with open(tmp_path, 'w') as f:
             json.dump(data, f, indent=4)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.findings_path)
+
+    def flush_findings(self):
+        """Write buffered findings updates to disk"""
+        with self._findings_lock:
+            if self._pending_updates:
+                if self.journal:
+                    self._journal_file.flush()
+                    os.fsync(self._journal_file.fileno())
+                else:
+                    self._write_findings(self.findings)
+                self._pending_updates = 0
+            self._last_flush = time.monotonic()
+
+    def _append_to_journal(self, key, value):
+        """Append one update to the findings journal (O(1) per update)"""
+        if self._journal_file is None:
+            self._journal_file = open(self.journal_path, 'a', encoding='utf-8')
+        entry = {'key': list(key) if isinstance(key, tuple) else key, 'value': value}
+        self._journal_file.write(json.dumps(entry) + '\n')
+        self._journal_file.flush()
+
+    def _iter_journal(self):
+        """Lazily yield the (key, value) updates recorded in the findings journal"""
+        if not self.journal_path.is_file():
+            return
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A torn last line after a crash; everything before it is valid
+                    logging.warning(f"Ignoring truncated journal entry in {self.journal_path}")
+                    break
+                key = entry['key']
+                yield (tuple(key) if isinstance(key, list) else key), entry['value']
+
+    def _replay_journal(self, findings):
+        """Apply the journal on top of findings loaded from findings.json"""
+        for key, value in self._iter_journal():
+            self._apply_update(findings, key, value)
+        return findings
+
+    def compact_findings(self):
+        """Fold the journal into findings.json and start a fresh journal"""
+        with self._findings_lock:
+            self._write_findings(self.findings)
+            if self._journal_file is not None:
+                self._journal_file.close()
+                self._journal_file = None
+            if self.journal_path.exists():
+                self.journal_path.unlink()
+            self._pending_updates = 0
+            self._last_flush = time.monotonic()
+        logging.info(f"Compacted findings journal into {self.findings_path}")
 
     def _append_to_summaries(self, content):
         """Append content to the initial summaries file"""
@@ -81,13 +1252,11 @@ class ProjectAnalyzer:
             f.write(f"{content}\n\n")
 
     def _read_findings(self):
-        """Read current findings from JSON file"""
-        with open(self.findings_path, 'r') as f:
-            return json.load(f)
+        """Current findings (kept in memory, flushed to the JSON file by the flush policy)"""
+        return self.findings
 
-    def _update_findings(self, key, value):
-        """Update specific section in findings"""
-        findings = self._read_findings()
+    @staticmethod
+    def _apply_update(findings, key, value):
         if isinstance(key, tuple):  # For nested updates
             current = findings
             for k in key[:-1]:
@@ -95,21 +1264,378 @@ class ProjectAnalyzer:
             current[key[-1]] = value
         else:
             findings[key] = value
-        self._write_findings(findings)
+
+    def _update_findings(self, key, value):
+        """Update specific section in findings"""
+        with self._findings_lock:
+            self._apply_update(self._read_findings(), key, value)
+            if self.journal:
+                self._append_to_journal(key, value)
+            self._pending_updates += 1
+            if self.flush_policy.should_flush(self._pending_updates, time.monotonic() - self._last_flush):
+                self.flush_findings()
+
+    def _exclusion_patterns(self):
+        """EXCLUSION_LIST plus the config file and the project's ignore files"""
+        patterns = list(EXCLUSION_LIST)
+
+        config_path = Path(os.environ.get('GUIDE_CONFIG', self.script_dir / CONFIG_FILE_NAME))
+        if config_path.is_file():
+            with open(config_path, 'r') as f:
+                patterns.extend(json.load(f).get('exclude', []))
+
+        for name in IGNORE_FILE_NAMES:
+            patterns.extend(read_patterns(self.project_dir / name))
+        return patterns
 
     def is_excluded(self, path):
-        return any(excluded in str(path) for excluded in EXCLUSION_LIST)
+        path = Path(path)
+        if path.is_absolute():
+            try:
+                path = path.relative_to(self.project_dir)
+            except ValueError:
+                pass
+        return self.matcher.matches(path)
 
-    def analyze_root(self):
-        logging.info("Analyzing root directory...")
-        root_contents = [str(f.relative_to(self.project_dir)) for f in Path(self.project_dir).rglob('*') 
-                        if not self.is_excluded(f)]
-        root_contents_str = '\n'.join(root_contents)
-
-        message = self.client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=8192,
-            temperature=0,
+    def _rel(self, path):
+        return str(Path(path).relative_to(self.project_dir))
+
+    def _merkle_hashes(self, directories):
+        """Merkle hash of every directory, built bottom-up from its files and subdirectories"""
+        hashes = {}
+        children = {}
+        for dir_path in reversed(directories):
+            rel_path = self._rel(dir_path)
+            entries = list(children.pop(rel_path, []))
+            for file in self._scan().files(rel_path):
+                entries.append(f"file {Path(file.path).name} {file.hash}")
+
+            # Prompt settings are part of the hash so changing them invalidates reuse
+            hashes[rel_path] = SummaryCache.make_key(PROMPT_VERSION, MODEL, TEMPERATURE, *sorted(entries))
+            if rel_path != '.':
+                parent = str(Path(rel_path).parent)
+                children.setdefault(parent, []).append(f"dir {Path(rel_path).name} {hashes[rel_path]}")
+        return dict(sorted(hashes.items()))
+
+    def _previous_run_dirs(self):
+        """Findings directories of earlier runs, most recent first"""
+        findings_root = self.script_dir / 'findings'
+        for candidate in sorted(findings_root.iterdir(), reverse=True):
+            if candidate.name < self.timestamp:
+                yield candidate
+
+    def _load_previous_inventory(self):
+        """Inventory of the most recent earlier run of this project"""
+        for candidate in self._previous_run_dirs():
+            if not (candidate / 'inventory.json').is_file():
+                continue
+            try:
+                inventory = Inventory.load(candidate / 'inventory.json')
+            except (OSError, ValueError, KeyError, TypeError):
+                continue
+            if inventory.project_dir == self.project_dir:
+                return inventory
+        return None
+
+    def _load_previous_findings(self):
+        """Findings of the most recent earlier run of this project that recorded Merkle hashes"""
+        for candidate in self._previous_run_dirs():
+            if not (candidate / 'findings.json').is_file():
+                continue
+            try:
+                with open(candidate / 'findings.json', 'r') as f:
+                    findings = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if findings.get('project_dir') == str(self.project_dir) and findings.get('merkle'):
+                return candidate.name, findings
+        return None, None
+
+    def _prepare_incremental_run(self, directories):
+        """Hash the tree and load the previous run so unchanged directories can be reused"""
+        if self.merkle:  # Already prepared for this run
+            return
+        self.merkle = self._merkle_hashes(directories)
+        self._update_findings('merkle', self.merkle)
+        self.previous_timestamp, self.previous_findings = self._load_previous_findings()
+        if self.previous_findings:
+            logging.info(f"Comparing against previous run {self.previous_timestamp}")
+
+    def _unchanged(self, rel_path):
+        """True when the Merkle hash of rel_path matches the previous run"""
+        current = self.merkle.get(rel_path)
+        return (current is not None and self.previous_findings is not None
+                and self.previous_findings['merkle'].get(rel_path) == current)
+
+    def _known_directory(self, rel_path, files):
+        """Summaries already in the findings (resumed run) or reusable from the previous run"""
+        if rel_path in self.findings['directories']:
+            logging.info(f"Skipping already analyzed directory: {rel_path}")
+            summaries = [self.findings['files'].get(self._rel(f)) for f in files]
+            return summaries, self.findings['directories'][rel_path]
+        return self._previous_directory(rel_path, files)
+
+    def _previous_directory(self, rel_path, files):
+        """File and directory summaries of the previous run when the directory is unchanged"""
+        if not self._unchanged(rel_path) or rel_path not in self.previous_findings['directories']:
+            return None
+        try:
+            summaries = [self.previous_findings['files'][self._rel(f)] for f in files]
+        except KeyError:
+            return None
+        logging.info(f"Reusing unchanged directory: {rel_path}")
+        return summaries, self.previous_findings['directories'][rel_path]
+
+    def _previous_root_summary(self):
+        if self._unchanged('.') and self.previous_findings.get('root_summary'):
+            logging.info("Reusing unchanged root summary")
+            return self.previous_findings['root_summary']
+        return None
+
+    def _previous_guidebook(self):
+        """Guidebook of the previous run when the root hash did not change"""
+        if not self._unchanged('.'):
+            return None
+        guidebook_path = self.script_dir / f'guidebook_{self.previous_timestamp}.md'
+        return guidebook_path if guidebook_path.is_file() else None
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying error, or None if it should not be retried"""
+        if isinstance(error, anthropic.APIStatusError) and error.status_code in RETRY_STATUS_CODES:
+            retry_after = RateLimiter._retry_after(error.response.headers)
+        elif isinstance(error, (anthropic.APIConnectionError, httpx.TransportError)):
+            # Connection failures, and streams that stalled past the idle timeout or broke off
+            retry_after = None
+        else:
+            return None
+        if attempt + 1 >= MAX_ATTEMPTS:
+            return None
+        delay = retry_after if retry_after is not None else RateLimiter.backoff(attempt)
+        reason = str(error) or type(error).__name__
+        if isinstance(error, (anthropic.APITimeoutError, httpx.TimeoutException)):
+            reason = f"stream stalled for {self.stream_idle_timeout:g}s"
+        logging.warning(f"Claude request failed ({reason}), retrying in {delay:.1f}s "
+                        f"(attempt {attempt + 1}/{MAX_ATTEMPTS})")
+        return delay
+
+    def _release_after_error(self, error):
+        throttled = isinstance(error, anthropic.APIStatusError) and error.status_code in (429, 529)
+        headers = error.response.headers if isinstance(error, anthropic.APIStatusError) else None
+        self.rate_limiter.release(headers, throttled=throttled)
+
+    def _create_message(self, request, call=None, on_text=None):
+        """Stream a messages request through the rate limiter and return the text of the reply.
+
+        call names the request in the metrics of the findings, e.g. ('files', rel_path).
+        on_text receives the text deltas as they arrive, and None when a partly
+        streamed reply is abandoned for a retry.
+        """
+        cost = estimate_request_tokens(request)
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            self.rate_limiter.acquire(cost)
+            sent = time.monotonic()
+            first_token = None
+            try:
+                with self.client.messages.stream(**request, timeout=self.stream_idle_timeout) as stream:
+                    for text in stream.text_stream:
+                        if first_token is None:
+                            first_token = self._first_token(call, sent, on_text)
+                        if on_text is not None:
+                            on_text(text)
+                    message = stream.get_final_message()
+                    headers = stream.response.headers
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                # Interrupted: hand the slot back so the requests still running can finish
+                self.rate_limiter.release()
+                raise
+            except Exception as e:
+                self._release_after_error(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if first_token is not None and on_text is not None:
+                    on_text(None)
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.rate_limiter.release(headers)
+            return self._finish_message(message, call, on_text, started, sent, first_token, attempt)
+
+    def _first_token(self, call, sent, on_text):
+        """Time of the first text delta, logged for replies that are shown while they stream"""
+        first_token = time.monotonic()
+        if on_text is not None:
+            logging.info(f"{call[-1]}: first token after {first_token - sent:.1f}s")
+        return first_token
+
+    def _finish_message(self, message, call, on_text, started, sent, first_token, attempt):
+        """Record the metrics of a streamed reply and return its text"""
+        finished = time.monotonic()
+        metrics = self._record_usage(message, call, latency=finished - sent, wall=finished - started,
+                                     first_token=first_token - sent if first_token is not None else None,
+                                     retries=attempt)
+        if on_text is not None and metrics['output_tokens_per_second'] is not None:
+            logging.info(f"{call[-1]}: {metrics['output_tokens']} tokens in {finished - sent:.1f}s "
+                         f"({metrics['output_tokens_per_second']:.0f} tokens/s)")
+        return message.content[0].text
+
+    @staticmethod
+    def _call_metrics(message, latency=None, wall=None, first_token=None, retries=0, price_factor=1.0):
+        """Metrics of one reply: token usage, cost, model, latency, streaming speed and retries"""
+        usage = getattr(message, 'usage', None)
+        metrics = {field: getattr(usage, field, None) or 0 for field in USAGE_FIELDS}
+        metrics['cost_usd'] = round(usage_cost(metrics, price_factor), 6)
+        metrics['model'] = getattr(message, 'model', None) or MODEL
+        # latency covers the successful attempt, wall also the rate limiter waits and retries;
+        # batch replies have neither
+        metrics['latency_seconds'] = round(latency, 3) if latency is not None else None
+        metrics['wall_seconds'] = round(wall, 3) if wall is not None else None
+        metrics['time_to_first_token_seconds'] = round(first_token, 3) if first_token is not None else None
+        streaming = latency - first_token if first_token is not None else None
+        metrics['output_tokens_per_second'] = (
+            round(metrics['output_tokens'] / streaming, 1) if streaming else None)
+        metrics['retries'] = retries
+        return metrics
+
+    def _record_usage(self, message, call=None, **timings):
+        """Add a reply to the run's token usage and store its metrics under call, if given"""
+        metrics = self._call_metrics(message, **timings)
+        with self._usage_lock:
+            for field in USAGE_FIELDS:
+                self.usage[field] += metrics[field]
+        if call is not None:
+            self._update_findings(('metrics', 'calls') + call, metrics)
+        return metrics
+
+    def _log_usage(self):
+        """Log the token usage so far and store it in the findings"""
+        usage = dict(self.usage)
+        self._update_findings('usage', usage)
+        prompt_tokens = usage['input_tokens'] + usage['cache_creation_input_tokens'] + usage['cache_read_input_tokens']
+        hit_rate = usage['cache_read_input_tokens'] / prompt_tokens if prompt_tokens else 0
+        logging.info(f"Tokens: {prompt_tokens} input ({usage['cache_read_input_tokens']} read from and "
+                     f"{usage['cache_creation_input_tokens']} written to the prompt cache, {hit_rate:.0%} cached), "
+                     f"{usage['output_tokens']} output")
+
+    @staticmethod
+    def _add_metrics(totals, metrics):
+        """Add the metrics of one call to a running total"""
+        totals['calls'] = totals.get('calls', 0) + 1
+        for field in USAGE_FIELDS + ['cost_usd', 'latency_seconds']:
+            totals[field] = totals.get(field, 0) + (metrics.get(field) or 0)
+        return totals
+
+    @staticmethod
+    def _round_metrics(totals):
+        totals['cost_usd'] = round(totals['cost_usd'], 6)
+        totals['latency_seconds'] = round(totals['latency_seconds'], 3)
+        return totals
+
+    def _rollup_metrics(self, calls):
+        """File and directory call metrics summed per directory, and per directory subtree"""
+        # Chunks of a large file ('path#n') belong to the directory of the file, like the file itself
+        owned = [(str(Path(rel_path).parent), metrics)
+                 for kind in ('files', 'chunks') for rel_path, metrics in calls.get(kind, {}).items()]
+        owned += calls.get('directories', {}).items()
+        # A pack belongs to the deepest directory holding all of its files
+        for metrics in calls.get('packs', {}).values():
+            if metrics.get('files'):
+                owned.append((os.path.commonpath([str(Path(f).parent) for f in metrics['files']]) or '.', metrics))
+        rollup = {}
+        for rel_path, metrics in owned:
+            self._add_metrics(rollup.setdefault(rel_path, {}), metrics)
+            for ancestor in [rel_path, *map(str, Path(rel_path).parents)]:
+                self._add_metrics(rollup.setdefault(ancestor, {}).setdefault('subtree', {}), metrics)
+        for totals in rollup.values():
+            if 'calls' not in totals:  # Only its subdirectories made calls
+                self._add_metrics(totals, {})['calls'] = 0
+            self._round_metrics(totals)
+            self._round_metrics(totals['subtree'])
+        return rollup
+
+    def _log_metrics(self):
+        """Roll the per-call metrics up, store them and log where the run spent its time and money"""
+        calls = self._read_findings().get('metrics', {}).get('calls', {})
+        if not calls:
+            return
+        # Calls are recorded as they complete: store them sorted, so the same run always writes the same file
+        calls = {kind: entries if kind == 'root' else dict(sorted(entries.items()))
+                 for kind, entries in sorted(calls.items())}
+        self._update_findings(('metrics', 'calls'), calls)
+        totals, by_kind, streamed = {}, {}, []
+        for kind, entries in calls.items():
+            for metrics in ([entries] if kind == 'root' else entries.values()):
+                self._add_metrics(totals, metrics)
+                self._add_metrics(by_kind.setdefault(kind, {}), metrics)
+                if metrics.get('output_tokens_per_second') is not None:
+                    streamed.append(metrics)
+        self._round_metrics(totals)
+        totals['by_kind'] = {kind: self._round_metrics(kind_totals) for kind, kind_totals in by_kind.items()}
+        rollup = dict(sorted(self._rollup_metrics(calls).items()))
+        self._update_findings(('metrics', 'totals'), totals)
+        self._update_findings(('metrics', 'directories'), rollup)
+
+        kinds_str = ', '.join(f"{kind} ${kind_totals['cost_usd']:.4f}" for kind, kind_totals in by_kind.items())
+        logging.info(f"Cost: ${totals['cost_usd']:.4f} for {totals['calls']} calls ({kinds_str})")
+        if streamed:
+            first_token = statistics.median(metrics['time_to_first_token_seconds'] for metrics in streamed)
+            speed = statistics.median(metrics['output_tokens_per_second'] for metrics in streamed)
+            logging.info(f"Streaming: median time to first token {first_token:.2f}s, "
+                         f"median {speed:.0f} output tokens/s")
+        directories = sorted(rollup.items(), key=lambda item: item[1]['cost_usd'], reverse=True)[:METRICS_REPORT_TOP]
+        if directories:
+            logging.info("Most expensive directories: " + ', '.join(
+                f"{rel_path} (${own['cost_usd']:.4f}, subtree ${own['subtree']['cost_usd']:.4f})"
+                for rel_path, own in directories))
+        files = calls.get('files', {})
+        expensive = sorted(files.items(), key=lambda item: item[1]['cost_usd'], reverse=True)[:METRICS_REPORT_TOP]
+        if expensive:
+            logging.info("Most expensive files: " + ', '.join(
+                f"{rel_path} (${metrics['cost_usd']:.4f})" for rel_path, metrics in expensive))
+        timed = [(rel_path, metrics) for rel_path, metrics in files.items() if metrics['latency_seconds'] is not None]
+        slowest = sorted(timed, key=lambda item: item[1]['latency_seconds'], reverse=True)[:METRICS_REPORT_TOP]
+        if slowest:
+            logging.info("Slowest files: " + ', '.join(
+                f"{rel_path} ({metrics['latency_seconds']:.2f}s)" for rel_path, metrics in slowest))
+
+    def _cached_request(self, system, instructions, details):
+        """messages.create request whose stable prefix is marked for prompt caching.
+
+        The system prompt, the project overview and the instructions are the
+        same for every file (or directory), so they come first and end with a
+        cache_control breakpoint; only the details after it change per call.
+        """
+        prefix = instructions
+        if self.project_overview:
+            prefix = f"Overview do projeto:\n{self.project_overview}\n\n{instructions}"
+        return dict(
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            system=[{"type": "text", "text": system}],
+            messages=[{
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": prefix, "cache_control": {"type": "ephemeral"}},
+                    {"type": "text", "text": details},
+                ]
+            }]
+        )
+
+    def _root_contents(self):
+        """Relative paths of every non-excluded entry in the project"""
+        contents = []
+        for tree in self._scan().directories.values():
+            contents.extend(sorted(tree['subdirs'] + tree['files'], key=lambda rel: rel.rsplit('/', 1)[-1]))
+        return contents
+
+    def _root_request(self, root_contents_str):
+        return dict(
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
             system="Você é um assistente de IA que resume a linguagem principal, assim como o propósito de um projeto.",
             messages=[{
                 "role": "user",
@@ -122,49 +1648,377 @@ class ProjectAnalyzer:
             }]
         )
 
-        summary = message.content[0].text
+    def _record_root(self, summary):
+        if self.findings['root_summary'] == summary:  # Already recorded by a resumed run
+            return
         self._update_findings('root_summary', summary)
         self._append_to_summaries(f"Overview do projeto:\n{summary}")
         logging.info("Root analysis complete")
 
-    def analyze_file(self, file_path):
+    def _summarize_root(self):
+        """Root overview, reused from the findings or the previous run when possible (thread safe)"""
+        summary = self.findings['root_summary'] or self._previous_root_summary()
+        if summary is None:
+            root_contents_str = '\n'.join(self._root_contents())
+            summary = self._create_message(self._root_request(root_contents_str), ('root',))
+        self.project_overview = summary
+        return summary
+
+    def analyze_root(self):
+        logging.info("Analyzing root directory...")
+        self._record_root(self._summarize_root())
+
+    def _map(self, func, items):
+        """Apply func to every item, concurrently when max_workers > 1, keeping input order"""
+        if self.max_workers <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(items))) as executor:
+            return list(executor.map(func, items))
+
+    def _read_file(self, file_path):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            return f.read()
+
+    def _file_request(self, rel_path, content):
+        return self._cached_request(
+            "Você é um assistente de IA que analisa arquivos de código-fonte.",
+            "Analise o arquivo indicado abaixo. Por favor, providencie as informações abaixo:\n"
+            "1. Objetivo geral do arquivo\n"
+            "2. Lista de todos os campos/variáveis e suas finalidades\n"
+            "3. Definições de funções com entradas, saídas e propósitos\n"
+            "4. Quaisquer estruturas/classes e seu significado\n"
+            "5. Como este arquivo se encaixa no projeto\n"
+            "Todas as informações devem ser geradas em Português do Brasil.",
+            f"Analise este arquivo: {rel_path}\n\nContent:\n{content}"
+        )
+
+    def _file_cache_key(self, content):
+        # The root overview in the prompt is shared context, not part of the key: a new
+        # overview (any file added or renamed) would otherwise invalidate every summary
+        return SummaryCache.make_key('file', content_hash(content), PROMPT_VERSION, MODEL, TEMPERATURE)
+
+    def _summarize_content(self, file_path, content):
+        """Summary of already read file content, served from the cache when possible"""
         rel_path = str(Path(file_path).relative_to(self.project_dir))
-        logging.info(f"Analyzing file: {rel_path}")
+        try:
+            cache_key = self._file_cache_key(content)
+            summary = self.pack_results.get(cache_key) or self.cache.get(cache_key)
+            if summary is None:
+                if self._needs_chunking(content):
+                    summary = self._summarize_chunks(rel_path, content)
+                else:
+                    summary = self._create_message(self._file_request(rel_path, content), ('files', rel_path))
+                self.cache.put(cache_key, summary)
+            return summary
+
+        except Exception as e:
+            logging.error(f"Error analyzing file {file_path}: {str(e)}")
+            return None
+
+    @staticmethod
+    def _needs_chunking(content):
+        return estimate_tokens(content) > CHUNK_THRESHOLD_TOKENS
+
+    @staticmethod
+    def _file_chunks(rel_path, content):
+        return split_into_chunks(content, detect_file_type(Path(rel_path).name, b''))
+
+    def _chunk_cache_key(self, text):
+        # Keyed on the chunk text alone, so a chunk keeps its summary when code before it moves
+        return SummaryCache.make_key('chunk', content_hash(text), PROMPT_VERSION, MODEL, TEMPERATURE)
+
+    def _chunk_request(self, rel_path, index, chunks):
+        first, last, text = chunks[index]
+        return self._cached_request(
+            "Você é um assistente de IA que analisa arquivos de código-fonte.",
+            "Analise o trecho indicado abaixo, que é parte de um arquivo grande demais para ser analisado de uma "
+            "só vez. Por favor, providencie as informações abaixo sobre este trecho:\n"
+            "1. Objetivo do trecho\n"
+            "2. Lista de todos os campos/variáveis e suas finalidades\n"
+            "3. Definições de funções com entradas, saídas e propósitos\n"
+            "4. Quaisquer estruturas/classes e seu significado\n"
+            "Todas as informações devem ser geradas em Português do Brasil.",
+            f"Analise a parte {index + 1} de {len(chunks)} (linhas {first}-{last}) do arquivo: {rel_path}\n\n"
+            f"Content:\n{text}"
+        )
+
+    def _merge_request(self, rel_path, chunk_summaries):
+        return self._cached_request(
+            "Você é um assistente de IA que analisa arquivos de código-fonte.",
+            "Os resumos abaixo descrevem, em ordem, as partes de um arquivo grande. Combine-os em um único "
+            "resumo do arquivo. Por favor, providencie as informações abaixo:\n"
+            "1. Objetivo geral do arquivo\n"
+            "2. Lista de todos os campos/variáveis e suas finalidades\n"
+            "3. Definições de funções com entradas, saídas e propósitos\n"
+            "4. Quaisquer estruturas/classes e seu significado\n"
+            "5. Como este arquivo se encaixa no projeto\n"
+            "Todas as informações devem ser geradas em Português do Brasil.",
+            f"Combine os resumos das partes deste arquivo: {rel_path}\n\n{chunk_summaries}"
+        )
+
+    def _chunk_digest_cache_key(self, text):
+        return SummaryCache.make_key('chunk digest', content_hash(text), PROMPT_VERSION, MODEL, TEMPERATURE)
+
+    def _chunk_digest_request(self, rel_path, text):
+        return self._cached_request(
+            "Você é um assistente de IA que analisa arquivos de código-fonte.",
+            "Os resumos abaixo descrevem, em ordem, partes consecutivas de um arquivo grande. Condense-os em um "
+            "resumo único e mais curto dessas partes, indicando as linhas que ele cobre. Preserve o objetivo de "
+            "cada parte, os campos/variáveis, as definições de funções com entradas, saídas e propósitos e as "
+            "estruturas/classes.\n"
+            "Todas as informações devem ser geradas em Português do Brasil.",
+            f"Condense os resumos destas partes do arquivo: {rel_path}\n\n{text}"
+        )
+
+    @staticmethod
+    def _format_chunk_summaries(chunks, summaries):
+        return [f"Parte {index + 1} de {len(chunks)} (linhas {first}-{last}):\n{summary}"
+                for index, ((first, last, _), summary) in enumerate(zip(chunks, summaries))]
+
+    def _summarize_chunk(self, rel_path, index, chunks):
+        """Summary of one chunk of a large file, served from the cache when possible (thread safe)"""
+        cache_key = self._chunk_cache_key(chunks[index][2])
+        summary = self.cache.get(cache_key)
+        if summary is None:
+            summary = self._create_message(self._chunk_request(rel_path, index, chunks),
+                                           ('chunks', f"{rel_path}#{index + 1}"))
+            self.cache.put(cache_key, summary)
+        return summary
 
+    def _digest_chunk_summaries(self, rel_path, text):
+        """Condensed version of consecutive chunk summaries of a large file, served from the cache when possible"""
+        cache_key = self._chunk_digest_cache_key(text)
+        digest = self.cache.get(cache_key)
+        if digest is None:
+            digest = self._create_message(self._chunk_digest_request(rel_path, text),
+                                          ('chunks', f"{rel_path}#digest {cache_key[:12]}"))
+            self.cache.put(cache_key, digest)
+        return digest
+
+    def _summarize_chunks(self, rel_path, content):
+        """Summary of a large file merged from the summaries of its chunks, summarized concurrently"""
+        chunks = self._file_chunks(rel_path, content)
+        logging.info(f"Splitting {rel_path} into {len(chunks)} chunks")
+        summaries = self._map(lambda index: self._summarize_chunk(rel_path, index, chunks), list(range(len(chunks))))
+        merged = self._condense(self._format_chunk_summaries(chunks, summaries),
+                                functools.partial(self._digest_chunk_summaries, rel_path))
+        return self._create_message(self._merge_request(rel_path, merged), ('files', rel_path))
+
+    def _iter_pending_files(self, directories, max_tokens=None, duplicates=None):
+        """Yield (rel_path, content, cache key) for every file summary that is not known or cached yet.
+
+        Identical files are yielded once; the later copies are recorded in
+        the duplicates dict (rel_path -> cache key) when one is given. With
+        max_tokens, files estimated above it from their inventory size are
+        skipped without being read.
+        """
+        seen = set()
+        inventory = self._scan()
+        for dir_path in directories:
+            rel_path = self._rel(dir_path)
+            if rel_path in self.findings['directories'] or (
+                    self._unchanged(rel_path) and rel_path in self.previous_findings['directories']):
+                continue
+            for file in self._list_files(dir_path):
+                file_rel = self._rel(file)
+                if file_rel in self.findings['files']:
+                    continue
+                entry = inventory.entries.get(file_rel)
+                if max_tokens is not None and entry is not None and entry.size // CHARS_PER_TOKEN > max_tokens:
+                    continue
+                try:
+                    content = self._read_file(file)
+                except Exception as e:
+                    logging.error(f"Error analyzing file {file}: {str(e)}")
+                    continue
+                cache_key = self._file_cache_key(content)
+                if cache_key in seen and duplicates is not None:
+                    duplicates[file_rel] = cache_key
+                if cache_key in seen or cache_key in self.cache:
+                    continue
+                seen.add(cache_key)
+                yield file_rel, content, cache_key
+
+    def _plan_packs(self, directories):
+        """Next-fit bin packing of the small pending files in walk order, so neighbours share a pack"""
+        if self.pack_file_tokens <= 0:
+            return []
+        packs, size, duplicates = [], 0, {}
+        for pending in self._iter_pending_files(directories, max_tokens=self.pack_file_tokens, duplicates=duplicates):
+            tokens = estimate_tokens(pending[1])
+            if tokens > self.pack_file_tokens:
+                continue
+            if not packs or len(packs[-1]) >= PACK_MAX_FILES or size + tokens > PACK_MAX_TOKENS:
+                packs.append([])
+                size = 0
+            packs[-1].append(pending)
+            size += tokens
+        # A lone file is cheaper as a regular request
+        packs = [pack for pack in packs if len(pack) > 1]
+        self.pack_keys = {rel_path: cache_key for pack in packs for rel_path, _, cache_key in pack}
+        # Copies of a packed file are served by its pack too
+        packed = set(self.pack_keys.values())
+        self.pack_keys.update((rel_path, key) for rel_path, key in duplicates.items() if key in packed)
+        if packs:
+            logging.info(f"Packing {sum(map(len, packs))} small files into {len(packs)} requests")
+        return packs
+
+    def _pack_members(self, packs):
+        """Index in packs of the pack serving every packed file, copies included: rel_path -> index"""
+        index = {cache_key: i for i, pack in enumerate(packs) for _, _, cache_key in pack}
+        return {rel_path: index[cache_key] for rel_path, cache_key in self.pack_keys.items()}
+
+    def _pack_request(self, pack):
+        files_str = '\n\n'.join(f'<file path="{rel_path}">\n{content}\n</file>' for rel_path, content, _ in pack)
+        return self._cached_request(
+            "Você é um assistente de IA que analisa arquivos de código-fonte.",
+            "Analise separadamente cada um dos arquivos pequenos indicados abaixo. Para cada arquivo, "
+            "providencie de forma concisa as informações abaixo:\n"
+            "1. Objetivo geral do arquivo\n"
+            "2. Lista de todos os campos/variáveis e suas finalidades\n"
+            "3. Definições de funções com entradas, saídas e propósitos\n"
+            "4. Quaisquer estruturas/classes e seu significado\n"
+            "5. Como este arquivo se encaixa no projeto\n"
+            "Responda com um bloco <file path=\"caminho\">resumo</file> por arquivo, com o caminho exatamente "
+            "como indicado e na mesma ordem, sem texto fora dos blocos.\n"
+            "Todas as informações devem ser geradas em Português do Brasil.",
+            f"Analise estes {len(pack)} arquivos:\n\n{files_str}"
+        )
+
+    @staticmethod
+    def _pack_call(pack):
+        return ('packs', f"pack {SummaryCache.make_key(*(cache_key for _, _, cache_key in pack))[:12]}")
+
+    def _store_pack_reply(self, pack, call, reply):
+        """Split a pack reply into file summaries; files missing from it, or cut off, are left pending"""
+        self._update_findings(('metrics', 'calls') + call + ('files',), [rel_path for rel_path, _, _ in pack])
+        summaries = {}
+        for rel_path, summary in PACK_REPLY_PATTERN.findall(reply):
+            summaries.setdefault(rel_path, summary.strip())
+        missing = 0
+        for rel_path, _, cache_key in pack:
+            if summaries.get(rel_path):
+                self.pack_results[cache_key] = summaries[rel_path]
+                self.cache.put(cache_key, summaries[rel_path])
+            else:
+                missing += 1
+        if missing:
+            logging.warning(f"{missing} of {len(pack)} files are missing from the reply of {call[-1]}, "
+                            f"they will be summarized one by one")
+
+    def _summarize_pack(self, pack):
+        """Summarize a pack of small files with one request (thread safe)"""
+        call = self._pack_call(pack)
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            message = self.client.messages.create(
-                model="claude-3-7-sonnet-20250219",
-                max_tokens=8192,
-                temperature=0,
-                system="Você é um assistente de IA que analisa arquivos de código-fonte.",
-                messages=[{
-                    "role": "user",
-                    "content": [{
-                        "type": "text",
-                        "text": f"Analise este arquivo: {rel_path}\n\nContent:\n{content}\n\n"
-                        "Por favor, providencie as informações abaixo:\n"
-                        "1. Objetivo geral do arquivo\n"
-                        "2. Lista de todos os campos/variáveis e suas finalidades\n"
-                        "3. Definições de funções com entradas, saídas e propósitos\n"
-                        "4. Quaisquer estruturas/classes e seu significado\n"
-                        "5. Como este arquivo se encaixa no projeto\n"
-                        "Todas as informações devem ser geradas em Português do Brasil."
-                    }]
-                }]
-            )
+            reply = self._create_message(self._pack_request(pack), call)
+        except Exception as e:
+            logging.error(f"Error analyzing {call[-1]}: {str(e)}")
+            return
+        self._store_pack_reply(pack, call, reply)
 
-            summary = message.content[0].text
-            self._update_findings(('files', rel_path), summary)
-            self._append_to_summaries(f"File: {rel_path}\n{summary}")
-            logging.info(f"Completed analysis of file: {rel_path}")
+    def _run_packs(self, directories):
+        """Summarize the small pending files in packs, so the regular analysis finds them cached"""
+        packs = self._plan_packs(directories)
+        if not packs:
+            return
+        # Pack prompts include the root overview, like file prompts
+        self.analyze_root()
+        self._map(self._summarize_pack, packs)
+
+    def _packed_summary(self, rel_path):
+        """Summary a pack returned for rel_path, found without reading the file again"""
+        cache_key = self.pack_keys.get(rel_path)
+        return self.pack_results.get(cache_key) if cache_key is not None else None
+
+    def _summarize_file(self, file_path):
+        """Ask Claude for a file summary without touching the findings (thread safe)"""
+        rel_path = str(Path(file_path).relative_to(self.project_dir))
+        if rel_path in self.findings['files']:  # Already analyzed by a resumed run
+            return self.findings['files'][rel_path]
+        logging.info(f"Analyzing file: {rel_path}")
+        summary = self._packed_summary(rel_path)
+        if summary is not None:
             return summary
 
+        try:
+            content = self._read_file(file_path)
         except Exception as e:
             logging.error(f"Error analyzing file {file_path}: {str(e)}")
             return None
+        return self._summarize_content(file_path, content)
+
+    def _record_file(self, file_path, summary):
+        """Store a file summary in the findings and the summaries file"""
+        rel_path = str(Path(file_path).relative_to(self.project_dir))
+        if self.findings['files'].get(rel_path) == summary:  # Already recorded by a resumed run
+            return
+        self._update_findings(('files', rel_path), summary)
+        self._append_to_summaries(f"File: {rel_path}\n{summary}")
+        logging.info(f"Completed analysis of file: {rel_path}")
+
+    def analyze_file(self, file_path):
+        summary = self._summarize_file(file_path)
+        if summary:
+            self._record_file(file_path, summary)
+        return summary
+
+    def _list_files(self, dir_path):
+        """Files of a directory that should be analyzed, in a stable order"""
+        inventory = self._scan()
+        rel_path = self._rel(dir_path)
+        if rel_path in inventory.directories:
+            return [self.project_dir / entry.path for entry in inventory.files(rel_path) if entry.type != 'binary']
+        return sorted(f for f in Path(dir_path).iterdir()
+                      if f.is_file() and not self.is_excluded(f))
+
+    def _subdirectories(self, rel_path):
+        """Project relative paths of the analyzed subdirectories of rel_path"""
+        tree = self._scan().directories.get(rel_path)
+        return tree['subdirs'] if tree is not None else []
+
+    def _format_file_summaries(self, files, summaries):
+        """Directory prompt entries for the files that were summarized"""
+        return [f"{file.name}: {summary}" for file, summary in zip(files, summaries) if summary]
+
+    def _format_subdirectory_summaries(self, subdirs, summaries):
+        """Directory prompt entries for the subdirectories that were summarized"""
+        return [f"{Path(subdir).name}/: {summary}" for subdir, summary in zip(subdirs, summaries) if summary]
+
+    def _directory_request(self, rel_path, file_summaries, subdirectory_summaries=()):
+        # Leaf directories have no subdirectories (and some directories no files): empty sections are left out
+        details = f"Analise este diretório: {rel_path}"
+        if file_summaries:
+            details += "\n\nFiles:\n" + '\n'.join(file_summaries)
+        if subdirectory_summaries:
+            details += "\n\nSubdirectories:\n" + '\n'.join(subdirectory_summaries)
+        return self._cached_request(
+            "Você é um assistente de IA que analisa diretórios de código.",
+            "Forneça um resumo do propósito do diretório indicado abaixo, incluindo seus subdiretórios, "
+            "e como seu conteúdo funciona em conjunto.\n"
+            "O resumo deve ser gerado em Português do Brasil.",
+            details
+        )
+
+    def _summarize_directory(self, rel_path, file_summaries, subdirectory_summaries=()):
+        """Ask Claude for a directory summary based on its file and subdirectory summaries (thread safe)"""
+        return self._create_message(self._directory_request(rel_path, file_summaries, subdirectory_summaries),
+                                    ('directories', rel_path))
+
+    def _reduce_directory(self, rel_path, files, subdirs, *summaries):
+        """Directory summary from the summaries of its files followed by those of its subdirectories"""
+        file_summaries = self._format_file_summaries(files, summaries[:len(files)])
+        subdirectory_summaries = self._format_subdirectory_summaries(subdirs, summaries[len(files):])
+        if file_summaries or subdirectory_summaries:
+            return self._summarize_directory(rel_path, file_summaries, subdirectory_summaries)
+        return None
+
+    def _record_directory(self, rel_path, summary):
+        """Store a directory summary in the findings and the summaries file"""
+        if self.findings['directories'].get(rel_path) == summary:  # Already recorded by a resumed run
+            return
+        self._update_findings(('directories', rel_path), summary)
+        self._append_to_summaries(f"Directory: {rel_path}\n{summary}")
+        logging.info(f"Completed analysis of directory: {rel_path}")
 
     def analyze_directory(self, dir_path):
         if self.is_excluded(dir_path):
@@ -174,170 +2028,986 @@ class ProjectAnalyzer:
         logging.info(f"Analyzing directory: {rel_path}")
 
         try:
-            # Get list of files in directory
-            files = [f for f in Path(dir_path).iterdir() 
-                    if f.is_file() and not self.is_excluded(f)]
+            # Get list of files in directory; subdirectories were summarized before it
+            files = self._list_files(dir_path)
+            subdirs = self._subdirectories(rel_path)
+            subdirectory_summaries = [self.findings['directories'].get(subdir) for subdir in subdirs]
 
-            if not files:  # Skip empty directories
+            if not files and not any(subdirectory_summaries):  # Skip empty directories
+                return
+
+            # Resumed or unchanged directories keep their existing summaries
+            previous = self._known_directory(rel_path, files)
+            if previous is not None:
+                self._commit_directory(rel_path, files, previous[0], resolved_future(previous[1]))
                 return
 
             # Analyze each file first
-            file_summaries = []
-            for file in files:
-                summary = self.analyze_file(str(file))
+            summaries = self._map(self._summarize_file, files)
+            for file, summary in zip(files, summaries):
                 if summary:
-                    file_summaries.append(f"{file.name}: {summary}")
+                    self._record_file(file, summary)
 
             # Analyze directory as a whole
-            if file_summaries:
-                message = self.client.messages.create(
-                    model="claude-3-7-sonnet-20250219",
-                    max_tokens=8192,
-                    temperature=0,
-                    system="Você é um assistente de IA que analisa diretórios de código.",
-                    messages=[{
-                        "role": "user",
-                        "content": [{
-                            "type": "text",
-                            "text": f"Analise este diretório: {rel_path}\n\nFiles:\n{''.join(file_summaries)}\n\n"
-                            "Forneça um resumo do propósito deste diretório e como seu conteúdo funciona em conjunto.\n"
-                            "O resumo deve ser gerado em Português do Brasil."
-                        }]
-                    }]
-                )
-
-                summary = message.content[0].text
-                self._update_findings(('directories', rel_path), summary)
-                self._append_to_summaries(f"Directory: {rel_path}\n{summary}")
-                logging.info(f"Completed analysis of directory: {rel_path}")
+            summary = self._reduce_directory(rel_path, files, subdirs, *summaries, *subdirectory_summaries)
+            if summary:
+                self._record_directory(rel_path, summary)
 
         except Exception as e:
             logging.error(f"Error analyzing directory {dir_path}: {str(e)}")
 
+    def _scan(self):
+        """Build the project inventory once per run; every phase reuses it"""
+        if self.inventory is None:
+            start = time.monotonic()
+            previous = self._load_previous_inventory()
+            self.inventory = Inventory.build(self.project_dir, self.is_excluded, previous=previous)
+            self.inventory.save(self.inventory_path)
+            if previous is not None:
+                changes = self.inventory.diff(previous)
+                logging.info(f"Since the previous run: {len(changes['added'])} added, "
+                             f"{len(changes['changed'])} changed, {len(changes['removed'])} removed")
+            logging.info(f"Scanned project in {time.monotonic() - start:.2f}s")
+        return self.inventory
+
+    def _walk_directories(self, bottom_up=False):
+        """Directories to analyze in a deterministic order: top-down, or every directory after its subdirectories"""
+        tree = self._scan().directories
+        if bottom_up:
+            # Depth-first pre-order with siblings reversed, reversed: a post-order in name order
+            order, stack = [], ['.']
+            while stack:
+                rel = stack.pop()
+                order.append(rel)
+                stack.extend(tree[rel]['subdirs'])
+            order.reverse()
+        else:
+            order = list(tree)
+        return [str(self.project_dir) if rel == '.' else str(self.project_dir / rel) for rel in order]
+
+    def _estimate_file_cost(self, file_path):
+        """Estimated tokens (input + summary) of analyzing a file, from its size in the inventory"""
+        rel_path = self._rel(file_path)
+        entry = self._scan().entries.get(rel_path)
+        size = entry.size if entry is not None else Path(file_path).stat().st_size
+        return (size // CHARS_PER_TOKEN + estimate_request_tokens(self._file_request(rel_path, ''))
+                + EXPECTED_SUMMARY_TOKENS)
+
+    def _estimate_pack_cost(self, pack):
+        """Estimated tokens (input + summaries) of a pack request"""
+        return estimate_request_tokens(self._pack_request(pack)) + len(pack) * EXPECTED_SUMMARY_TOKENS
+
+    def _estimate_directory_cost(self, entry_count):
+        """Estimated tokens of a directory reduce over entry_count file and subdirectory summaries"""
+        return (entry_count + 1) * EXPECTED_SUMMARY_TOKENS
+
+    def _analyze_project_concurrently(self, directories):
+        """Run the root, file and directory summaries as one task graph, committing results in walk order"""
+        with PriorityPool(self.max_workers) as pool:
+            graph = TaskGraph(pool)
+            try:
+                self._run_task_graph(graph, directories)
+            except BaseException:
+                # Interrupted: drop queued work so the pool shuts down promptly
+                graph.cancel()
+                raise
+
+        report = schedule_report(pool.timings, pool.workers, graph.chains())
+        if report is not None:
+            self._update_findings('schedule', report)
+            logging.info(f"Schedule: makespan {report['makespan_seconds']}s, lower bound "
+                         f"{report['lower_bound_seconds']}s (work {report['work_seconds']}s over "
+                         f"{report['workers']} workers, critical path {report['critical_path_seconds']}s), "
+                         f"{report['makespan_over_lower_bound']}x the bound")
+
+    def _run_task_graph(self, graph, directories):
+        """Build the root -> [pack ->] file -> directory graph, run it and commit the results in walk order"""
+        logging.info("Analyzing root directory...")
+        # File prompts include the root overview and every commit waits for it, so it runs first
+        root_future = graph.add('root', self._summarize_root, priority=float('inf'))
+
+        # Longest processing time first: every task is prioritized by the estimated
+        # length of its chain to the end of the run (its own cost plus the reduces
+        # of its directory and all of its ancestors), so the critical path starts early.
+        # A ready reduce therefore does not preempt queued files in general: it only runs
+        # before files whose chain is shorter, such as those of shallower directories
+        listings = {self._rel(dir_path): self._list_files(dir_path) for dir_path in directories}
+        chain_costs = {}
+        for rel_path in self._scan().directories:  # Top-down, parents first
+            entries = len(listings.get(rel_path, [])) + len(self._subdirectories(rel_path))
+            parent = None if rel_path == '.' else str(Path(rel_path).parent)
+            chain_costs[rel_path] = self._estimate_directory_cost(entries) + chain_costs.get(parent, 0)
+
+        # Packs are tasks too: the files they cover wait for them and only fall back to a
+        # request of their own when missing from the reply. A pack gates the chains of all
+        # of its directories, so it is prioritized by the longest of them
+        packs = self._plan_packs(directories)
+        pack_of = self._pack_members(packs)
+        pack_chains = [0] * len(packs)
+        for rel_path, index in pack_of.items():
+            pack_chains[index] = max(pack_chains[index], chain_costs.get(str(Path(rel_path).parent), 0))
+        pack_tasks = [('pack', self._pack_call(pack)[-1]) for pack in packs]
+        for key, pack, chain_cost in zip(pack_tasks, packs, pack_chains):
+            graph.add(key, self._summarize_pack, args=(pack,), after=['root'],
+                      priority=self._estimate_pack_cost(pack) + chain_cost)
+
+        # Directories come bottom-up, so every subdirectory is in the graph before its parent
+        jobs = []
+        for dir_path in directories:
+            rel_path = self._rel(dir_path)
+            files = listings[rel_path]
+            subdirs = [subdir for subdir in self._subdirectories(rel_path) if ('directory', subdir) in graph]
+            if not files and not subdirs:  # Skip empty directories
+                continue
+            logging.info(f"Analyzing directory: {rel_path}")
+            previous = self._known_directory(rel_path, files)
+            if previous is not None:
+                # Resumed or unchanged directories keep their existing summaries
+                futures = [graph.done(('file', self._rel(f)), s) for f, s in zip(files, previous[0])]
+                jobs.append((rel_path, files, futures, graph.done(('directory', rel_path), previous[1])))
+                continue
+
+            chain_cost = chain_costs.get(rel_path, 0)
+            futures = []
+            for f in files:
+                # A packed file waits for its pack instead of requesting a summary of its own
+                after = ['root'] if self._rel(f) not in pack_of else ['root', pack_tasks[pack_of[self._rel(f)]]]
+                futures.append(graph.add(('file', self._rel(f)), self._summarize_file, args=(str(f),), after=after,
+                                         priority=self._estimate_file_cost(f) + chain_cost))
+            deps = [('file', self._rel(f)) for f in files] + [('directory', subdir) for subdir in subdirs]
+            dir_future = graph.add(('directory', rel_path), self._reduce_directory, args=(rel_path, files, subdirs),
+                                   deps=deps, priority=chain_cost)
+            jobs.append((rel_path, files, futures, dir_future))
+        graph.start()
+
+        self._record_root(root_future.result())
+        for rel_path, files, futures, dir_future in jobs:
+            self._commit_directory(rel_path, files, [future.result() for future in futures], dir_future)
+
+    def _commit_directory(self, rel_path, files, summaries, dir_future):
+        """Record the results of a directory analyzed by the concurrent engine"""
+        for file, summary in zip(files, summaries):
+            if summary:
+                self._record_file(file, summary)
+
+        if dir_future is None:
+            return
+        try:
+            summary = dir_future.result()
+        except Exception as e:
+            logging.error(f"Error analyzing directory {self.project_dir / rel_path}: {str(e)}")
+            return
+        if summary:
+            self._record_directory(rel_path, summary)
+
+    def _finish_findings(self):
+        if self.journal:
+            self.compact_findings()
+        else:
+            self.flush_findings()
+
+    def _log_run_stats(self):
+        self._log_usage()
+        self._log_metrics()
+        stats = self.cache.stats()
+        logging.info(f"Summary cache: {stats['hits']} hits, {stats['misses']} misses, "
+                     f"{stats['entries']} entries ({stats['bytes']} bytes)")
+        logging.info(f"Rate limiter: {self.rate_limiter.throttled} throttled responses, "
+                     f"concurrency window {self.rate_limiter.window:.1f}/{self.rate_limiter.max_concurrency}")
+
     def analyze_project(self):
         """First phase: analyze the project and collect initial summaries"""
         logging.info(f"Starting analysis of project: {self.project_dir}")
         
-        # Analyze root first
-        self.analyze_root()
-        
-        # Recursively analyze directories and files
-        for root, dirs, files in os.walk(self.project_dir):
-            # Filter out excluded directories
-            dirs[:] = [d for d in dirs if not self.is_excluded(d)]
-            
-            # Analyze current directory
-            self.analyze_directory(root)
+        self._prepare_incremental_run(self._walk_directories())
+
+        # Bottom-up, so every directory summary can build on those of its subdirectories
+        directories = self._walk_directories(bottom_up=True)
+        if self.max_workers > 1:
+            # Root, packs, files and directories run as one task graph on a shared pool
+            self._analyze_project_concurrently(directories)
+        else:
+            # Small files are summarized in packs, and the root with them, before the walk
+            self._run_packs(directories)
+            self.analyze_root()
+
+            # Recursively analyze directories and files
+            for dir_path in directories:
+                self.analyze_directory(dir_path)
 
+        self._log_run_stats()
+        self._finish_findings()
         logging.info("Project analysis complete")
         return self.initial_summaries_path, self.findings_path
 
     def generate_developer_guide(self):
         """Second phase: generate a well-organized developer guide in markdown"""
         logging.info("Generating developer guide...")
+
+        # The guide only needs regenerating when something in the project changed
+        previous_guidebook = self._previous_guidebook()
+        if previous_guidebook is not None:
+            logging.info(f"Project unchanged, reusing {previous_guidebook.name}")
+            return self._write_guide(previous_guidebook.read_text(encoding='utf-8'))
         
         # Read the collected data
-        with open(self.findings_path, 'r') as f:
-            findings = json.load(f)
-        
-        with open(self.initial_summaries_path, 'r') as f:
-            initial_summaries = f.read()
+        findings = self._load_guide_inputs()
 
-        # Generate the final guidebook
-        guidebook_content = self._create_markdown_guide(findings, initial_summaries)
-        
-        # Write the final guidebook
+        # Generate the final guidebook, written to disk while it streams in
+        guidebook_path = self._create_markdown_guide(findings)
+        self._log_usage()
+        self._log_metrics()
+        # The guide's metrics and usage were recorded after the analysis phase finished the findings
+        self._finish_findings()
+        return guidebook_path
+
+    def _load_guide_inputs(self):
+        self.flush_findings()
+        return self._read_findings()
+
+    @staticmethod
+    def _summary_sections(findings):
+        """Project overview followed by the directory summaries, every directory before its subdirectories"""
+        sections = [f"Overview do projeto:\n{findings['root_summary']}"]
+        directories = findings['directories']
+        for rel_path in sorted(directories, key=lambda rel: [] if rel == '.' else rel.split('/')):
+            depth = 0 if rel_path == '.' else rel_path.count('/') + 1
+            sections.append(f"{'#' * min(depth + 1, 6)} Directory: {rel_path}\n{directories[rel_path]}")
+        return sections
+
+    @staticmethod
+    def _partition(sections, budget):
+        """Group consecutive sections into chunks of at most budget estimated tokens"""
+        max_chars = budget * CHARS_PER_TOKEN
+        chunks, chunk, size = [], [], 0
+        for section in sections:
+            # A section that exceeds the budget on its own is split into pieces
+            for start in range(0, max(len(section), 1), max_chars):
+                piece = section[start:start + max_chars]
+                tokens = estimate_tokens(piece)
+                if chunk and size + tokens > budget:
+                    chunks.append('\n\n'.join(chunk))
+                    chunk, size = [], 0
+                chunk.append(piece)
+                size += tokens
+        if chunk:
+            chunks.append('\n\n'.join(chunk))
+        return chunks
+
+    @staticmethod
+    def _is_test_file(rel_path):
+        parts = Path(rel_path).parts
+        return any(part in ('test', 'tests') for part in parts[:-1]) or re.match(r'test_|.*_test\.', parts[-1]) is not None
+
+    def _section_context(self, findings, context):
+        """Summaries a guide section is written from, see GUIDE_SECTIONS"""
+        sections = self._summary_sections(findings)
+        if context == 'tree':
+            return sections
+        if context == 'overview':
+            root = findings['directories'].get('.')
+            return sections[:1] + ([f"# Directory: .\n{root}"] if root else [])
+
+        matching = []
+        for rel_path in findings['files']:
+            file_type = detect_file_type(Path(rel_path).name, b'')
+            is_test = self._is_test_file(rel_path)
+            if ((context == 'setup' and file_type in SETUP_FILE_TYPES)
+                    or (context == 'workflow' and (file_type in WORKFLOW_FILE_TYPES or is_test))
+                    or (context == 'api' and file_type not in SETUP_FILE_TYPES and not is_test)):
+                matching.append(rel_path)
+        entries = self._scan().entries
+
+        def relevance(rel_path):
+            entry = entries.get(rel_path)
+            return rel_path.count('/'), -(entry.size if entry is not None else 0), rel_path
+
+        selected = sorted(sorted(matching, key=relevance)[:GUIDE_CONTEXT_FILES])
+        return sections + [f"File: {rel_path}\n{findings['files'][rel_path]}" for rel_path in selected]
+
+    def _next_round(self, sections):
+        """Chunks to condense when sections exceed the guide prompt budget, or None when they fit"""
+        guide_budget = GUIDE_INPUT_BUDGET - max(estimate_request_tokens(self._section_request(index, ''))
+                                                for index in range(len(GUIDE_SECTIONS)))
+        if estimate_tokens('\n\n'.join(sections)) <= guide_budget:
+            return None
+        chunks = self._partition(sections, GUIDE_INPUT_BUDGET - estimate_request_tokens(self._digest_request('')))
+        logging.info(f"Guide input exceeds {guide_budget} tokens, condensing {len(sections)} sections "
+                     f"into {len(chunks)} digests")
+        return chunks
+
+    def _digest_cache_key(self, text):
+        return SummaryCache.make_key('digest', content_hash(text), PROMPT_VERSION, MODEL, TEMPERATURE)
+
+    def _digest(self, text):
+        """Condensed version of a chunk of summaries, served from the cache when possible (thread safe)"""
+        cache_key = self._digest_cache_key(text)
+        digest = self.cache.get(cache_key)
+        if digest is None:
+            digest = self._create_message(self._digest_request(text), ('guide', f"digest {cache_key[:12]}"))
+            self.cache.put(cache_key, digest)
+        return digest
+
+    def _condense(self, sections, digest=None):
+        """Sections joined for a guide prompt, condensed by map-reduce when they exceed GUIDE_INPUT_BUDGET.
+
+        digest condenses one chunk of sections; the default is _digest, for project summaries.
+        """
+        digest = digest or self._digest
+        chunks = self._next_round(sections)
+        while chunks:
+            # Map: digest every chunk in parallel; reduce: the digests become the next round's sections
+            sections = self._map(digest, chunks)
+            chunks = self._next_round(sections)
+        return '\n\n'.join(sections)
+
+    def _digest_request(self, text):
+        return dict(
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
+            system="Você é um escritor técnico especialista que condensa documentação de projetos de software.",
+            messages=[{
+                "role": "user",
+                "content": [{
+                    "type": "text",
+                    "text": f"Condense os seguintes resumos de um projeto em um resumo único e mais curto.\n\n{text}\n\n"
+                    "Preserve o propósito do projeto, as tecnologias, a arquitetura, os componentes e diretórios "
+                    "principais, as interfaces públicas, a configuração e o fluxo de trabalho de desenvolvimento.\n"
+                    "O resumo deve ser gerado em Português do Brasil."
+                }]
+            }]
+        )
+
+    def _write_guide(self, guidebook_content):
         guidebook_path = self.script_dir / f'guidebook_{self.timestamp}.md'
         with open(guidebook_path, 'w', encoding='utf-8') as f:
             f.write(guidebook_content)
         
         return guidebook_path
 
-    def _create_markdown_guide(self, findings, initial_summaries):
-        """Create the markdown developer guide using collected data"""
-        
-        message = self.client.messages.create(
-            model="claude-3-7-sonnet-20250219",
-            max_tokens=8192,
-            temperature=0,
+    def _create_markdown_guide(self, findings):
+        """Write the markdown developer guide, one concurrent streamed request per section"""
+        contexts = {}
+        for context in dict.fromkeys(context for _, _, context in GUIDE_SECTIONS):
+            contexts[context] = self._condense(self._section_context(findings, context))
+        with self._open_guide(findings) as writer:
+            def write_section(index):
+                self._create_message(self._section_request(index, contexts[GUIDE_SECTIONS[index][2]]),
+                                     ('guide', GUIDE_SECTIONS[index][0]), functools.partial(writer.write, index))
+                writer.finish(index)
+            self._map(write_section, list(range(len(GUIDE_SECTIONS))))
+        return writer.path
+
+    @staticmethod
+    def _section_heading(index):
+        return f"{index + 1}. {GUIDE_SECTIONS[index][0]}"
+
+    @staticmethod
+    def _anchor(heading):
+        """GitHub style anchor of a markdown heading"""
+        return re.sub(r'[^\w\- ]', '', heading.strip().lower()).replace(' ', '-')
+
+    def _open_guide(self, findings):
+        """GuideWriter of this run's guidebook, starting with a title and a generated table of contents"""
+        headings = [self._section_heading(index) for index in range(len(GUIDE_SECTIONS))]
+        header = (f"# Guia do Desenvolvedor: {Path(findings['project_dir']).name}\n\n## Índice\n\n" +
+                  '\n'.join(f"- [{heading}](#{self._anchor(heading)})" for heading in headings))
+        return GuideWriter(self.script_dir / f'guidebook_{self.timestamp}.md', header, headings, echo=self.echo)
+
+    def _section_request(self, index, context):
+        _, topics, _ = GUIDE_SECTIONS[index]
+        topics_str = '\n'.join(f"   - {topic}" for topic in topics)
+        return dict(
+            model=MODEL,
+            max_tokens=MAX_TOKENS,
+            temperature=TEMPERATURE,
             system="Você é um escritor técnico especialista que cria guias para desenvolvedores claros e bem organizados.",
             messages=[{
                 "role": "user",
                 "content": [{
                     "type": "text",
                     "text": f"""
-Com base nos seguintes dados de análise de projeto, crie um guia abrangente para desenvolvedores em formato markdown.
-
-Resumos Iniciais:
-{initial_summaries}
-
-Resultados detalhados:
-{json.dumps(findings, indent=2)}
-
-Crie um guia do desenvolvedor que inclua:
-
-1. Resumo Executivo
-   - Objetivo do projeto
-   - Principais tecnologias
-   - Principais características
-
-2. Arquitetura do Projeto
-   - Visão geral de alto nível
-   - Componentes principais
-   - Padrões de design usados
-   - Fluxo de dados
-
-3. Setup & Instalação
-   - Pré-requisitos
-   - Configuração do ambiente
-   - Configuração do projeto
-
-4. Organização do código
-   - Estrutura de diretório
-   - Arquivos-chave e seus propósitos
-   - Módulos/pacotes importantes
-
-5. Conceitos Básicos
-   - Abstrações principais
-   - Interfaces principais
-   - Modelos de dados
-
-6. Fluxo de trabalho de desenvolvimento
-   - Construção
-   - Teste
-   - Implantação
-
-7. Referência de API
-   - Funções principais
-   - Classes importantes
-   - Interfaces públicas
-
-8. Tarefas comuns
-   - Fluxos de trabalho de exemplo
-   - Exemplos de código
-   - Melhores práticas
-
-Torne o guia prático e fácil de seguir. Use títulos claros, exemplos de código onde for relevante e inclua quaisquer notas ou avisos importantes.
+Com base nos seguintes dados de análise de projeto, escreva a seção "{self._section_heading(index)}" de um guia para desenvolvedores em formato markdown.
+
+Resumos do projeto:
+{context}
+
+A seção deve incluir:
+{topics_str}
+
+Escreva apenas o conteúdo desta seção, sem repetir o seu título e sem outras seções; use subtítulos de nível 3 (###) quando necessário.
+Torne a seção prática e fácil de seguir. Use exemplos de código onde for relevante e inclua quaisquer notas ou avisos importantes.
 O documento deve ser gerado em Português do Brasil.
 """
                 }]
             }]
         )
 
-        return message.content[0].text
+class BatchProjectAnalyzer(ProjectAnalyzer):
+    """ProjectAnalyzer that summarizes files through the Message Batches API.
+
+    Every file summary that is neither known nor cached is submitted up front
+    as message batches, which trade latency for throughput and half the
+    price. The batch ids are stored in the findings, so a resumed run keeps
+    polling the same batches instead of submitting them again. Once every
+    batch has ended, the regular analysis runs with the file summaries
+    served from the batch results; files whose batch request failed are
+    summarized interactively. Directory summaries and the guide stay
+    interactive, since they depend on the file summaries.
+    """
+
+    def __init__(self, project_dir, poll_interval=BATCH_POLL_INTERVAL, **kwargs):
+        super().__init__(project_dir, **kwargs)
+        self.poll_interval = poll_interval
+        self.batch_results = {}  # file cache key -> summary
+        self.batch_metrics = {}  # file cache key -> metrics of its batch reply
+        self.batch_collected = set()  # custom ids of every collected result, failed ones included
+
+    def _batch_call(self, func, *args, **kwargs):
+        """Call a Message Batches endpoint, retrying transient errors like _create_message"""
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+
+    def _iter_batch_requests(self, directories):
+        """Yield (cache key, request) for every file summary that is not known or cached yet"""
+        for rel_path, content, cache_key in self._iter_pending_files(directories):
+            # Chunked files, and files whose batch request failed, are summarized interactively
+            if self._needs_chunking(content) or cache_key in self.batch_collected:
+                continue
+            # The cache key doubles as the custom_id
+            yield cache_key, self._file_request(rel_path, content)
+
+    def _create_batch(self, entries):
+        batch = self._batch_call(self.client.beta.messages.batches.create, requests=entries)
+        logging.info(f"Submitted batch {batch.id} with {len(entries)} file analyses")
+        # Persist the id right away so a restarted run resumes polling it
+        self._update_findings('batches', self.findings.get('batches', []) + [batch.id])
+        self.flush_findings()
+        return batch.id
+
+    def _submit_batches(self, directories):
+        """Submit the pending file analyses, split to respect the per-batch limits"""
+        batch_ids = []
+        entries, size = [], 0
+        for cache_key, request in self._iter_batch_requests(directories):
+            entry = {'custom_id': cache_key, 'params': request}
+            entry_size = len(json.dumps(entry))
+            if entries and (len(entries) >= BATCH_MAX_REQUESTS or size + entry_size > BATCH_MAX_BYTES):
+                batch_ids.append(self._create_batch(entries))
+                entries, size = [], 0
+            entries.append(entry)
+            size += entry_size
+        if entries:
+            batch_ids.append(self._create_batch(entries))
+        return batch_ids
+
+    def _wait_for_batch(self, batch_id):
+        while True:
+            batch = self._batch_call(self.client.beta.messages.batches.retrieve, batch_id)
+            if batch.processing_status == 'ended':
+                return batch
+            counts = batch.request_counts
+            logging.info(f"Batch {batch_id} {batch.processing_status}: {counts.processing} processing, "
+                         f"{counts.succeeded} succeeded, {counts.errored} errored")
+            time.sleep(self.poll_interval)
+
+    def _collect_batch_results(self, batch_id):
+        succeeded = failed = 0
+        for entry in self._batch_call(self.client.beta.messages.batches.results, batch_id):
+            self.batch_collected.add(entry.custom_id)
+            if entry.result.type != 'succeeded':
+                failed += 1
+                continue
+            message = entry.result.message
+            self.batch_metrics[entry.custom_id] = self._record_usage(message, price_factor=BATCH_PRICE_FACTOR)
+            summary = message.content[0].text
+            self.batch_results[entry.custom_id] = summary
+            self.cache.put(entry.custom_id, summary)
+            succeeded += 1
+        logging.info(f"Batch {batch_id} ended: {succeeded} succeeded, {failed} failed")
+        if failed:
+            logging.warning(f"{failed} file analyses of batch {batch_id} will be retried interactively")
+
+    def _run_batches(self, directories):
+        batch_ids = list(self.findings.get('batches', []))
+        if batch_ids:
+            logging.info(f"Resuming batches {', '.join(batch_ids)}")
+            self._collect_batches(batch_ids)
+        # A run interrupted while submitting stored only its first batches: the rest is submitted now
+        submitted = self._submit_batches(directories)
+        if not batch_ids and not submitted:
+            logging.info("Every file summary is known or cached, no batch to submit")
+        self._collect_batches(submitted)
+
+    def _collect_batches(self, batch_ids):
+        for batch_id in batch_ids:
+            self._wait_for_batch(batch_id)
+            self._collect_batch_results(batch_id)
+
+    def _summarize_content(self, file_path, content):
+        cache_key = self._file_cache_key(content)
+        summary = self.batch_results.get(cache_key)
+        if summary is not None:
+            # Identical files share one batch request, which is accounted to the first of them
+            metrics = self.batch_metrics.pop(cache_key, None)
+            if metrics is not None:
+                self._update_findings(('metrics', 'calls', 'files', self._rel(file_path)), metrics)
+            return summary
+        return super()._summarize_content(file_path, content)
+
+    def analyze_project(self):
+        """First phase: summarize the files through message batches, then analyze the project"""
+        self._prepare_incremental_run(self._walk_directories())
+        # File prompts include the root overview, so it is generated before the batches are built
+        self.analyze_root()
+        self._run_batches(self._walk_directories(bottom_up=True))
+        return super().analyze_project()
+
+class AsyncProjectAnalyzer(ProjectAnalyzer):
+    """asyncio flavour of ProjectAnalyzer built on anthropic.AsyncAnthropic.
+
+    analyze_project runs as a pipeline of walk -> file-read -> API stages
+    connected by bounded queues, so a slow stage applies backpressure to the
+    ones before it. The shared RateLimiter keeps at most max_workers requests
+    in flight at once.
+    """
+
+    def __init__(self, project_dir, queue_size=DEFAULT_QUEUE_SIZE, **kwargs):
+        super().__init__(project_dir, **kwargs)
+        self.queue_size = max(1, int(queue_size))
+        # Digests being requested, by cache key: contexts condensed concurrently share their chunks
+        self.digests = {}
+
+    def _create_client(self):
+        return anthropic.AsyncAnthropic(max_retries=0)
+
+    async def _run_blocking(self, func, *args):
+        """Run blocking file system work off the event loop"""
+        return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+
+    async def _create_message(self, request, call=None, on_text=None):
+        """Stream a messages request through the rate limiter and return the text of the reply"""
+        cost = estimate_request_tokens(request)
+        attempt = 0
+        started = time.monotonic()
+        while True:
+            await self.rate_limiter.acquire_async(cost)
+            sent = time.monotonic()
+            first_token = None
+            try:
+                async with self.client.messages.stream(**request, timeout=self.stream_idle_timeout) as stream:
+                    async for text in stream.text_stream:
+                        if first_token is None:
+                            first_token = self._first_token(call, sent, on_text)
+                        if on_text is not None:
+                            on_text(text)
+                    message = await stream.get_final_message()
+                    headers = stream.response.headers
+            except (KeyboardInterrupt, asyncio.CancelledError):
+                # Interrupted: hand the slot back so the requests still running can finish
+                self.rate_limiter.release()
+                raise
+            except Exception as e:
+                self._release_after_error(e)
+                delay = self._retry_delay(e, attempt)
+                if delay is None:
+                    raise
+                if first_token is not None and on_text is not None:
+                    on_text(None)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.rate_limiter.release(headers)
+            return self._finish_message(message, call, on_text, started, sent, first_token, attempt)
+
+    async def _summarize_root(self):
+        summary = self.findings['root_summary'] or self._previous_root_summary()
+        if summary is None:
+            root_contents_str = '\n'.join(await self._run_blocking(self._root_contents))
+            summary = await self._create_message(self._root_request(root_contents_str), ('root',))
+        self.project_overview = summary
+        return summary
+
+    async def analyze_root(self):
+        logging.info("Analyzing root directory...")
+        self._record_root(await self._summarize_root())
+
+    async def _summarize_content(self, file_path, content):
+        """Summary of already read file content, served from the cache when possible"""
+        rel_path = str(Path(file_path).relative_to(self.project_dir))
+        try:
+            cache_key = self._file_cache_key(content)
+            summary = self.pack_results.get(cache_key) or await self._run_blocking(self.cache.get, cache_key)
+            if summary is None:
+                if self._needs_chunking(content):
+                    summary = await self._summarize_chunks(rel_path, content)
+                else:
+                    summary = await self._create_message(self._file_request(rel_path, content), ('files', rel_path))
+                await self._run_blocking(self.cache.put, cache_key, summary)
+            return summary
+        except Exception as e:
+            logging.error(f"Error analyzing file {file_path}: {str(e)}")
+            return None
+
+    async def _summarize_chunk(self, rel_path, index, chunks):
+        cache_key = self._chunk_cache_key(chunks[index][2])
+        summary = await self._run_blocking(self.cache.get, cache_key)
+        if summary is None:
+            summary = await self._create_message(self._chunk_request(rel_path, index, chunks),
+                                                 ('chunks', f"{rel_path}#{index + 1}"))
+            await self._run_blocking(self.cache.put, cache_key, summary)
+        return summary
+
+    async def _digest_chunk_summaries(self, rel_path, text):
+        cache_key = self._chunk_digest_cache_key(text)
+        digest = await self._run_blocking(self.cache.get, cache_key)
+        if digest is None:
+            digest = await self._create_message(self._chunk_digest_request(rel_path, text),
+                                                ('chunks', f"{rel_path}#digest {cache_key[:12]}"))
+            await self._run_blocking(self.cache.put, cache_key, digest)
+        return digest
+
+    async def _summarize_chunks(self, rel_path, content):
+        chunks = await self._run_blocking(self._file_chunks, rel_path, content)
+        logging.info(f"Splitting {rel_path} into {len(chunks)} chunks")
+        summaries = await asyncio.gather(*(self._summarize_chunk(rel_path, index, chunks)
+                                           for index in range(len(chunks))))
+        merged = await self._condense(self._format_chunk_summaries(chunks, summaries),
+                                      functools.partial(self._digest_chunk_summaries, rel_path))
+        return await self._create_message(self._merge_request(rel_path, merged), ('files', rel_path))
+
+    async def _summarize_pack(self, pack):
+        call = self._pack_call(pack)
+        try:
+            reply = await self._create_message(self._pack_request(pack), call)
+        except Exception as e:
+            logging.error(f"Error analyzing {call[-1]}: {str(e)}")
+            return
+        await self._run_blocking(self._store_pack_reply, pack, call, reply)
+
+    async def _summarize_file(self, file_path):
+        rel_path = str(Path(file_path).relative_to(self.project_dir))
+        if rel_path in self.findings['files']:  # Already analyzed by a resumed run
+            return self.findings['files'][rel_path]
+        logging.info(f"Analyzing file: {rel_path}")
+        summary = self._packed_summary(rel_path)
+        if summary is not None:
+            return summary
+
+        try:
+            content = await self._run_blocking(self._read_file, file_path)
+        except Exception as e:
+            logging.error(f"Error analyzing file {file_path}: {str(e)}")
+            return None
+        return await self._summarize_content(file_path, content)
+
+    async def analyze_file(self, file_path):
+        summary = await self._summarize_file(file_path)
+        if summary:
+            self._record_file(file_path, summary)
+        return summary
+
+    async def _summarize_directory(self, rel_path, file_summaries, subdirectory_summaries=()):
+        return await self._create_message(self._directory_request(rel_path, file_summaries, subdirectory_summaries),
+                                          ('directories', rel_path))
+
+    async def _reduce_directory(self, rel_path, files, subdirs, *summaries):
+        file_summaries = self._format_file_summaries(files, summaries[:len(files)])
+        subdirectory_summaries = self._format_subdirectory_summaries(subdirs, summaries[len(files):])
+        if file_summaries or subdirectory_summaries:
+            return await self._summarize_directory(rel_path, file_summaries, subdirectory_summaries)
+        return None
+
+    async def analyze_directory(self, dir_path):
+        if self.is_excluded(dir_path):
+            return
+
+        rel_path = str(Path(dir_path).relative_to(self.project_dir))
+        logging.info(f"Analyzing directory: {rel_path}")
+
+        try:
+            # Get list of files in directory; subdirectories were summarized before it
+            files = await self._run_blocking(self._list_files, dir_path)
+            subdirs = self._subdirectories(rel_path)
+            subdirectory_summaries = [self.findings['directories'].get(subdir) for subdir in subdirs]
+
+            if not files and not any(subdirectory_summaries):  # Skip empty directories
+                return
+
+            # Resumed or unchanged directories keep their existing summaries
+            previous = self._known_directory(rel_path, files)
+            if previous is not None:
+                self._commit_directory(rel_path, files, previous[0], resolved_future(previous[1]))
+                return
+
+            # Analyze each file first
+            summaries = await asyncio.gather(*(self._summarize_file(str(f)) for f in files))
+            for file, summary in zip(files, summaries):
+                if summary:
+                    self._record_file(file, summary)
+
+            # Analyze directory as a whole
+            summary = await self._reduce_directory(rel_path, files, subdirs, *summaries, *subdirectory_summaries)
+            if summary:
+                self._record_directory(rel_path, summary)
+
+        except Exception as e:
+            logging.error(f"Error analyzing directory {dir_path}: {str(e)}")
+
+    async def _summarize_directory_when_ready(self, rel_path, files, subdirs, futures):
+        """Summarize a directory as soon as all of its files and subdirectories are done"""
+        summaries = await asyncio.gather(*futures, return_exceptions=True)
+        # A failed subdirectory contributes no summary, like a failed file
+        summaries = [None if isinstance(summary, BaseException) else summary for summary in summaries]
+        return await self._reduce_directory(rel_path, files, subdirs, *summaries)
+
+    async def analyze_project(self):
+        """First phase: analyze the project and collect initial summaries"""
+        logging.info(f"Starting analysis of project: {self.project_dir}")
+
+        await self._run_blocking(self._prepare_incremental_run, await self._run_blocking(self._walk_directories))
+        # Bottom-up, so every directory summary can build on those of its subdirectories
+        directories_to_walk = await self._run_blocking(self._walk_directories, True)
+        packs = await self._run_blocking(self._plan_packs, directories_to_walk)
+        pack_of = self._pack_members(packs)
+
+        # Every file and directory prompt includes the root overview, so it is resolved (or
+        # fails the run) before the pipeline starts; the stages only read project_overview
+        await self.analyze_root()
+
+        loop = asyncio.get_running_loop()
+        paths = asyncio.Queue(maxsize=self.queue_size)
+        contents = asyncio.Queue(maxsize=self.queue_size)
+        directories = asyncio.Queue(maxsize=self.queue_size)
+
+        def resolved(value):
+            future = loop.create_future()
+            future.set_result(value)
+            return future
+
+        # A pack is queued like a file, by its estimated cost, when the walk reaches its first
+        # file. Its files wait for it, then go through the read stage, which finds their
+        # summaries in the pack results or falls back to a request of their own
+        pack_futures, waiting = {}, []
+
+        async def after_pack(index, file, future):
+            await asyncio.wait([pack_futures[index]])
+            await paths.put((file, future))
+
+        async def walk():
+            dir_tasks = {}
+            for dir_path in directories_to_walk:
+                files = await self._run_blocking(self._list_files, dir_path)
+                rel_path = self._rel(dir_path)
+                subdirs = [subdir for subdir in self._subdirectories(rel_path) if subdir in dir_tasks]
+                if not files and not subdirs:  # Skip empty directories
+                    continue
+                logging.info(f"Analyzing directory: {rel_path}")
+                previous = self._known_directory(rel_path, files)
+                if previous is not None:
+                    # Resumed or unchanged directories keep their existing summaries
+                    futures = [resolved(summary) for summary in previous[0]]
+                    dir_tasks[rel_path] = resolved(previous[1])
+                    await directories.put((rel_path, files, futures, dir_tasks[rel_path]))
+                    continue
+                # Files already analyzed by a resumed run are not queued again
+                known = [self.findings['files'].get(self._rel(f)) for f in files]
+                futures = [resolved(summary) if summary else loop.create_future() for summary in known]
+                dir_tasks[rel_path] = asyncio.ensure_future(self._summarize_directory_when_ready(
+                    rel_path, files, subdirs, futures + [dir_tasks[subdir] for subdir in subdirs]))
+                await directories.put((rel_path, files, futures, dir_tasks[rel_path]))
+                # Largest jobs first so a directory's slowest file does not start last
+                jobs = []
+                for file, future in zip(files, futures):
+                    if future.done():
+                        continue
+                    index = pack_of.get(self._rel(file))
+                    if index is None:
+                        jobs.append((self._estimate_file_cost(file), file, future))
+                        continue
+                    if index not in pack_futures:
+                        pack_futures[index] = loop.create_future()
+                        jobs.append((self._estimate_pack_cost(packs[index]), packs[index], pack_futures[index]))
+                    waiting.append(asyncio.ensure_future(after_pack(index, file, future)))
+                for _, job, future in sorted(jobs, key=lambda job: job[0], reverse=True):
+                    await paths.put((job, future))
+            await directories.put(None)
+
+        async def read():
+            while True:
+                file, future = await paths.get()
+                if isinstance(file, list):  # A pack, planned with the contents of its files
+                    paths.task_done()
+                    await contents.put((None, file, future))
+                    continue
+                logging.info(f"Analyzing file: {file.relative_to(self.project_dir)}")
+                summary = self._packed_summary(self._rel(file))
+                if summary is not None:
+                    future.set_result(summary)
+                    paths.task_done()
+                    continue
+                try:
+                    content = await self._run_blocking(self._read_file, file)
+                except Exception as e:
+                    logging.error(f"Error analyzing file {file}: {str(e)}")
+                    future.set_result(None)
+                    continue
+                finally:
+                    paths.task_done()
+                await contents.put((file, content, future))
+
+        async def call():
+            while True:
+                file, content, future = await contents.get()
+                try:
+                    if file is None:
+                        future.set_result(await self._summarize_pack(content))
+                    else:
+                        future.set_result(await self._summarize_content(file, content))
+                finally:
+                    contents.task_done()
+
+        async def commit():
+            # Record results in walk order so the output matches a sequential run
+            while True:
+                job = await directories.get()
+                if job is None:
+                    return
+                rel_path, files, futures, dir_task = job
+                summaries = await asyncio.gather(*futures)
+                await asyncio.wait([dir_task])
+                self._commit_directory(rel_path, files, summaries, dir_task)
+
+        tasks = [asyncio.ensure_future(read()) for _ in range(self.max_workers)]
+        tasks += [asyncio.ensure_future(call()) for _ in range(self.max_workers)]
+        committer = asyncio.ensure_future(commit())
+        tasks += [asyncio.ensure_future(walk()), committer]
+        try:
+            # A stage that fails would leave the others blocked on its queue: stop the run instead
+            pending = set(tasks)
+            while not committer.done():
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    task.result()
+        finally:
+            for task in tasks + waiting:
+                task.cancel()
+            await asyncio.gather(*tasks, *waiting, return_exceptions=True)
+
+        self._log_run_stats()
+        self._finish_findings()
+        logging.info("Project analysis complete")
+        return self.initial_summaries_path, self.findings_path
+
+    async def _digest(self, text):
+        cache_key = self._digest_cache_key(text)
+        if cache_key not in self.digests:
+            self.digests[cache_key] = asyncio.ensure_future(self._request_digest(cache_key, text))
+        return await self.digests[cache_key]
+
+    async def _request_digest(self, cache_key, text):
+        digest = await self._run_blocking(self.cache.get, cache_key)
+        if digest is None:
+            digest = await self._create_message(self._digest_request(text), ('guide', f"digest {cache_key[:12]}"))
+            await self._run_blocking(self.cache.put, cache_key, digest)
+        return digest
+
+    async def _condense(self, sections, digest=None):
+        digest = digest or self._digest
+        chunks = self._next_round(sections)
+        while chunks:
+            sections = await asyncio.gather(*(digest(chunk) for chunk in chunks))
+            chunks = self._next_round(sections)
+        return '\n\n'.join(sections)
+
+    async def _create_markdown_guide(self, findings):
+        names = list(dict.fromkeys(context for _, _, context in GUIDE_SECTIONS))
+        contexts = dict(zip(names, await asyncio.gather(
+            *(self._condense(self._section_context(findings, name)) for name in names))))
+        with self._open_guide(findings) as writer:
+            async def write_section(index):
+                await self._create_message(self._section_request(index, contexts[GUIDE_SECTIONS[index][2]]),
+                                           ('guide', GUIDE_SECTIONS[index][0]), functools.partial(writer.write, index))
+                writer.finish(index)
+            await asyncio.gather(*(write_section(index) for index in range(len(GUIDE_SECTIONS))))
+        return writer.path
+
+    async def generate_developer_guide(self):
+        """Second phase: generate a well-organized developer guide in markdown"""
+        logging.info("Generating developer guide...")
+
+        # The guide only needs regenerating when something in the project changed
+        previous_guidebook = self._previous_guidebook()
+        if previous_guidebook is not None:
+            logging.info(f"Project unchanged, reusing {previous_guidebook.name}")
+            return await self._run_blocking(self._write_guide, previous_guidebook.read_text(encoding='utf-8'))
+
+        findings = await self._run_blocking(self._load_guide_inputs)
+        guidebook_path = await self._create_markdown_guide(findings)
+        self._log_usage()
+        self._log_metrics()
+        self._finish_findings()
+        return guidebook_path
+
+async def run_async(project_directory, **kwargs):
+    analyzer = AsyncProjectAnalyzer(project_directory, **kwargs)
+    analyzer.install_signal_handlers()
+    initial_summaries_path, findings_path = await analyzer.analyze_project()
+    guidebook_path = await analyzer.generate_developer_guide()
+    return initial_summaries_path, findings_path, guidebook_path
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate a developer guide for GUIDE_TARGET_PROJECT_DIRECTORY")
+    parser.add_argument('--resume', metavar='TIMESTAMP',
+                        help="continue the interrupted run stored in findings/TIMESTAMP")
+    return parser.parse_args()
 
 def main():
+    args = parse_args()
     project_directory = os.environ.get('GUIDE_TARGET_PROJECT_DIRECTORY')
     if not project_directory:
         logging.error("GUIDE_TARGET_PROJECT_DIRECTORY environment variable is not set.")
         return
 
-    # Phase 1: Analyze project
-    analyzer = ProjectAnalyzer(project_directory)
-    initial_summaries_path, findings_path = analyzer.analyze_project()
-    
-    # Phase 2: Generate developer guide
-    guidebook_path = analyzer.generate_developer_guide()
+    script_dir = Path(__file__).parent
+    options = dict(
+        max_workers=int(os.environ.get('GUIDE_MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+        cache=SummaryCache(os.environ.get('GUIDE_CACHE_DIR', script_dir / 'cache'),
+                           max_bytes=int(os.environ.get('GUIDE_CACHE_MAX_BYTES', DEFAULT_CACHE_MAX_BYTES))),
+        flush_policy=FlushPolicy(every=int(os.environ.get('GUIDE_FLUSH_EVERY', DEFAULT_FLUSH_EVERY)),
+                                 interval=float(os.environ.get('GUIDE_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL))),
+        journal=os.environ.get('GUIDE_JOURNAL') == '1',
+        resume=args.resume,
+        input_tokens_per_minute=int(os.environ['GUIDE_ITPM']) if os.environ.get('GUIDE_ITPM') else None,
+        stream_idle_timeout=float(os.environ.get('GUIDE_STREAM_IDLE_TIMEOUT', STREAM_IDLE_TIMEOUT)),
+        echo=os.environ.get('GUIDE_ECHO') == '1',
+        pack_file_tokens=int(os.environ.get('GUIDE_PACK_FILE_TOKENS', PACK_FILE_MAX_TOKENS)),
+    )
+
+    if os.environ.get('GUIDE_ASYNC') == '1':
+        initial_summaries_path, findings_path, guidebook_path = asyncio.run(
+            run_async(project_directory, **options))
+    else:
+        # Phase 1: Analyze project
+        if os.environ.get('GUIDE_BATCH') == '1':
+            analyzer = BatchProjectAnalyzer(project_directory, **options, poll_interval=float(
+                os.environ.get('GUIDE_BATCH_POLL_INTERVAL', BATCH_POLL_INTERVAL)))
+        else:
+            analyzer = ProjectAnalyzer(project_directory, **options)
+        analyzer.install_signal_handlers()
+        initial_summaries_path, findings_path = analyzer.analyze_project()
+
+        # Phase 2: Generate developer guide
+        guidebook_path = analyzer.generate_developer_guide()
 
     logging.info(f"Guide generation complete. Results saved to:\n"
                 f"Initial Summaries: {initial_summaries_path}\n"
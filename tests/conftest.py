@@ -0,0 +1,54 @@
+import sys
+from pathlib import Path
+
+import anthropic
+import pytest
+
+# guide.py and fake_server.py are plain scripts next to this directory
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fake_server  # noqa: E402
+import guide  # noqa: E402
+
+PROJECT_FILES = {
+    'main.py': "from pkg.util import greet\n\nif __name__ == '__main__':\n    print(greet('mundo'))\n",
+    'README.md': "# Projeto de exemplo\n",
+    'pkg/__init__.py': "",
+    'pkg/util.py': "def greet(name):\n    return f'Olá, {name}!'\n",
+    'pkg/models.py': "class User:\n    def __init__(self, name):\n        self.name = name\n",
+}
+
+@pytest.fixture
+def project(tmp_path):
+    """Small project of PROJECT_FILES: two directories, five files"""
+    root = tmp_path / 'project'
+    for rel_path, content in PROJECT_FILES.items():
+        path = root / rel_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding='utf-8')
+    return root
+
+@pytest.fixture
+def serve():
+    """Start fake servers with the given options; they are shut down after the test"""
+    servers = []
+
+    def start(**options):
+        server, base_url = fake_server.serve_in_background(**options)
+        servers.append(server)
+        return server, base_url
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+@pytest.fixture
+def make_analyzer(project, tmp_path):
+    """Build an analyzer of `project` talking to the fake server at base_url, with its output in tmp_path"""
+    def make(base_url, cls=guide.ProjectAnalyzer, **options):
+        client_cls = anthropic.AsyncAnthropic if issubclass(cls, guide.AsyncProjectAnalyzer) else anthropic.Anthropic
+        options.setdefault('client', client_cls(base_url=base_url, api_key='fake', max_retries=0))
+        options.setdefault('cache', guide.SummaryCache(tmp_path / 'cache'))
+        return cls(project, output_dir=tmp_path / 'output', **options)
+    return make
@@ -0,0 +1,99 @@
+import guide
+from conftest import PROJECT_FILES
+
+BATCH_DELAY = 0.3
+POLL_INTERVAL = 0.05
+
+def batch_analyzer(make_analyzer, base_url, **options):
+    # Packing is disabled so the files that fall back are summarized one request each
+    return make_analyzer(base_url, cls=guide.BatchProjectAnalyzer, poll_interval=POLL_INTERVAL,
+                         pack_file_tokens=0, **options)
+
+def submit_only(analyzer):
+    """The first steps of analyze_project, up to the batch submission: a run that crashed while polling"""
+    analyzer._prepare_incremental_run(analyzer._walk_directories())
+    analyzer.analyze_root()
+    return analyzer._submit_batches(analyzer._walk_directories(bottom_up=True))
+
+def interactive_files(analyzer):
+    """Files summarized by an interactive request; batch replies have no latency"""
+    calls = analyzer.findings['metrics']['calls'].get('files', {})
+    return {rel_path for rel_path, metrics in calls.items() if metrics['latency_seconds'] is not None}
+
+def test_files_are_summarized_through_a_batch(serve, make_analyzer):
+    server, base_url = serve(batch_delay=BATCH_DELAY)
+    analyzer = batch_analyzer(make_analyzer, base_url)
+    analyzer.analyze_project()
+
+    stats = server.fake.snapshot()
+    assert analyzer.findings['batches'] == ['msgbatch_000001']
+    assert stats['batches'] == 1
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+    assert all(summary.startswith('Resumo ') for summary in analyzer.findings['files'].values())
+    # Only the root overview and the two directories are interactive
+    assert stats['messages'] == 3
+    assert interactive_files(analyzer) == set()
+
+def test_errored_results_fall_back_to_interactive_requests(serve, make_analyzer):
+    server, base_url = serve(batch_delay=BATCH_DELAY, batch_error_rate=1.0)
+    analyzer = batch_analyzer(make_analyzer, base_url)
+    analyzer.analyze_project()
+
+    assert server.fake.snapshot()['batches'] == 1
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+    assert interactive_files(analyzer) == set(PROJECT_FILES)
+
+def test_canceled_results_fall_back_to_interactive_requests(serve, make_analyzer):
+    server, base_url = serve(batch_delay=60)
+    analyzer = batch_analyzer(make_analyzer, base_url)
+    batch_ids = submit_only(analyzer)
+    analyzer.client.beta.messages.batches.cancel(batch_ids[0])
+    analyzer.analyze_project()
+
+    # The canceled batch is collected, not submitted again
+    assert server.fake.snapshot()['batches'] == 1
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+    assert interactive_files(analyzer) == set(PROJECT_FILES)
+
+def test_resumed_run_polls_the_stored_batch(serve, make_analyzer):
+    server, base_url = serve(batch_delay=BATCH_DELAY)
+    first = batch_analyzer(make_analyzer, base_url)
+    batch_ids = submit_only(first)
+
+    resumed = batch_analyzer(make_analyzer, base_url, resume=first.timestamp)
+    assert resumed.findings['batches'] == batch_ids
+    resumed.analyze_project()
+
+    stats = server.fake.snapshot()
+    assert stats['batches'] == 1
+    assert set(resumed.findings['files']) == set(PROJECT_FILES)
+    assert interactive_files(resumed) == set()
+    # The root overview comes from the first run, the two directories from the resumed one
+    assert stats['messages'] == 3
+
+def test_resumed_run_submits_the_batches_it_never_created(serve, make_analyzer, monkeypatch):
+    monkeypatch.setattr(guide, 'BATCH_MAX_REQUESTS', 2)
+    server, base_url = serve(batch_delay=BATCH_DELAY)
+    first = batch_analyzer(make_analyzer, base_url)
+    create_batch = first._create_batch
+
+    def crash_after_first_batch(entries):
+        if first.findings.get('batches'):
+            raise RuntimeError("crashed while submitting")
+        return create_batch(entries)
+
+    first._create_batch = crash_after_first_batch
+    try:
+        submit_only(first)
+    except RuntimeError:
+        pass
+    assert len(first.findings['batches']) == 1
+
+    resumed = batch_analyzer(make_analyzer, base_url, resume=first.timestamp)
+    resumed.analyze_project()
+
+    # Five files, two per batch: the stored batch plus two new ones
+    assert server.fake.snapshot()['batches'] == 3
+    assert resumed.findings['batches'][0] == first.findings['batches'][0]
+    assert set(resumed.findings['files']) == set(PROJECT_FILES)
+    assert interactive_files(resumed) == set()
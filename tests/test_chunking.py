@@ -0,0 +1,56 @@
+import asyncio
+
+import pytest
+
+import guide
+
+def test_chunk_calls_have_their_own_kind(serve, make_analyzer, project):
+    functions = [f"def function_{index}(value):\n" + "    value += 1\n" * 40 + "    return value\n\n"
+                 for index in range(1200)]
+    (project / 'big.py').write_text(''.join(functions), encoding='utf-8')
+    server, base_url = serve()
+    analyzer = make_analyzer(base_url, max_workers=4, pack_file_tokens=0)
+    analyzer.analyze_project()
+
+    calls = analyzer.findings['metrics']['calls']
+    chunks = calls['chunks']
+    assert len(chunks) > 1
+    assert all(label.startswith('big.py#') for label in chunks)
+    # The file rankings only hold real files; big.py is its merge call
+    assert not any('#' in rel_path for rel_path in calls['files'])
+    assert 'big.py' in calls['files']
+    # Chunks still count toward the directory of their file
+    root_files = [rel_path for rel_path in calls['files'] if '/' not in rel_path]
+    directories = analyzer.findings['metrics']['directories']
+    assert directories['.']['calls'] == len(chunks) + len(root_files) + 1
+    assert analyzer.findings['metrics']['totals']['by_kind']['chunks']['calls'] == len(chunks)
+
+@pytest.mark.parametrize('cls', [guide.ProjectAnalyzer, guide.AsyncProjectAnalyzer])
+def test_condensed_chunk_summaries_are_file_chunk_calls(serve, make_analyzer, project, monkeypatch, cls):
+    functions = [f"def function_{index}(value):\n" + "    value += 1\n" * 40 + "    return value\n\n"
+                 for index in range(300)]
+    (project / 'big.py').write_text(''.join(functions), encoding='utf-8')
+    server, base_url = serve(output_tokens=1000)
+    analyzer = make_analyzer(base_url, cls=cls, max_workers=4, pack_file_tokens=0)
+    # Room for about three chunk summaries in the merge prompt, so the chunks of big.py are condensed first
+    section_tokens = max(guide.estimate_request_tokens(analyzer._section_request(index, ''))
+                         for index in range(len(guide.GUIDE_SECTIONS)))
+    monkeypatch.setattr(guide, 'GUIDE_INPUT_BUDGET', section_tokens + 4000)
+    requests = []
+    create_message = analyzer._create_message
+
+    def record(request, call, on_text=None):
+        requests.append((call, request['messages'][0]['content'][-1]['text']))
+        return create_message(request, call, on_text)
+
+    analyzer._create_message = record
+    if cls is guide.AsyncProjectAnalyzer:
+        asyncio.run(analyzer.analyze_project())
+    else:
+        analyzer.analyze_project()
+
+    digests = [(call, text) for call, text in requests if '#digest ' in call[-1]]
+    assert len(digests) > 1
+    assert all(call[:2] == ('chunks', call[1]) and call[1].startswith('big.py#digest ') for call, _ in digests)
+    assert all('partes do arquivo: big.py' in text for _, text in digests)
+    assert 'guide' not in analyzer.findings['metrics']['calls']
@@ -0,0 +1,126 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import fake_server
+import guide
+from conftest import PROJECT_FILES
+
+def request(text="Analise este arquivo: a.py"):
+    return dict(model=guide.MODEL, max_tokens=guide.MAX_TOKENS, temperature=guide.TEMPERATURE,
+                system="Você é um assistente de IA.", messages=[{"role": "user", "content": text}])
+
+def expected_text(fake, params):
+    return fake.message(params)['content'][0]['text']
+
+def first_request_only(monkeypatch, fake, method, **options):
+    """Set fake server options until `method` has handled one request, then restore them"""
+    original = getattr(fake, method)
+    for name, value in options.items():
+        monkeypatch.setattr(fake, name, value)
+
+    def once(*args):
+        try:
+            return original(*args)
+        finally:
+            monkeypatch.undo()
+
+    monkeypatch.setattr(fake, method, once)
+
+def test_replies_are_deterministic():
+    fake = fake_server.FakeAnthropic()
+    assert expected_text(fake, request()) == expected_text(fake_server.FakeAnthropic(), request())
+    assert expected_text(fake, request()) != expected_text(fake, request("Analise este arquivo: b.py"))
+
+def test_output_tokens_pad_replies_up_to_max_tokens():
+    fake = fake_server.FakeAnthropic(output_tokens=100)
+    assert len(expected_text(fake, request())) == 100 * fake_server.CHARS_PER_TOKEN
+    assert len(expected_text(fake, dict(request(), max_tokens=10))) == 10 * fake_server.CHARS_PER_TOKEN
+
+@pytest.mark.parametrize('latency', fake_server.LATENCY_DISTRIBUTIONS)
+def test_latency_distributions_have_the_configured_mean(latency):
+    fake = fake_server.FakeAnthropic(latency=latency, latency_mean=2.0, seed=1)
+    samples = [fake.sample_latency() for _ in range(5000)]
+    assert sum(samples) / len(samples) == pytest.approx(2.0, rel=0.1)
+    assert all(sample >= 0 for sample in samples)
+    # The same seed draws the same latencies
+    again = fake_server.FakeAnthropic(latency=latency, latency_mean=2.0, seed=1)
+    assert [again.sample_latency() for _ in range(5000)] == samples
+
+@pytest.mark.parametrize('injected', [dict(rate_limit_rate=1.0), dict(overload_rate=1.0)])
+def test_injected_errors_are_retried(serve, make_analyzer, monkeypatch, injected):
+    server, base_url = serve(retry_after=0.3)
+    first_request_only(monkeypatch, server.fake, 'admit', **injected)
+    analyzer = make_analyzer(base_url)
+
+    started = time.monotonic()
+    text = analyzer._create_message(request(), ('files', 'a.py'))
+
+    stats = server.fake.snapshot()
+    assert text == expected_text(server.fake, request())
+    assert stats['messages'] == 1
+    assert stats['rate_limited'] + stats['overloaded'] == 1
+    assert analyzer.findings['metrics']['calls']['files']['a.py']['retries'] == 1
+    if 'rate_limit_rate' in injected:
+        # The retry waited for the retry-after of the 429
+        assert time.monotonic() - started >= 0.3
+
+def test_stalled_stream_is_retried_after_the_idle_timeout(serve, make_analyzer, monkeypatch):
+    server, base_url = serve(stall_seconds=2.0, output_tokens=100)
+    first_request_only(monkeypatch, server.fake, 'sample_stall', stall_rate=1.0)
+    analyzer = make_analyzer(base_url, stream_idle_timeout=0.3)
+
+    started = time.monotonic()
+    text = analyzer._create_message(request(), ('files', 'a.py'))
+
+    stats = server.fake.snapshot()
+    assert text == expected_text(server.fake, request())
+    assert stats['stalled'] == 1
+    assert stats['messages'] == 2
+    assert analyzer.findings['metrics']['calls']['files']['a.py']['retries'] == 1
+    # Given up after the idle timeout, long before the server dropped the stalled stream
+    assert time.monotonic() - started < 2.0
+
+class ScriptedStream:
+    """Stream of a canned reply, as returned by client.messages.stream()"""
+
+    def __init__(self, text):
+        self.text = text
+        self.response = SimpleNamespace(headers={})
+        self.text_stream = iter([text[:5], text[5:]])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def get_final_message(self):
+        usage = SimpleNamespace(input_tokens=10, output_tokens=5)
+        return SimpleNamespace(content=[SimpleNamespace(text=self.text)], usage=usage, model=guide.MODEL)
+
+class ScriptedClient:
+    """LLMClient without HTTP: answers every request with a numbered reply"""
+
+    def __init__(self):
+        self.requests = []
+        self.messages = self
+
+    def stream(self, timeout=None, **request):
+        return ScriptedStream(self._record(request))
+
+    def _record(self, request):
+        self.requests.append(request)
+        return f"Resposta {len(self.requests)}"
+
+def test_analyzer_runs_on_an_injected_client(make_analyzer):
+    client = ScriptedClient()
+    analyzer = make_analyzer(None, client=client, pack_file_tokens=0)
+    analyzer.analyze_project()
+
+    # Root overview, five files and two directories
+    assert len(client.requests) == 8
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+    assert all(summary.startswith('Resposta ') for summary in analyzer.findings['files'].values())
+    assert analyzer.findings['root_summary'] == 'Resposta 1'
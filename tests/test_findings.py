@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+import pytest
+
+import guide
+
+@pytest.mark.parametrize('journal', [False, True])
+@pytest.mark.parametrize('cls', [guide.ProjectAnalyzer, guide.AsyncProjectAnalyzer])
+def test_guide_metrics_reach_findings_json(serve, make_analyzer, cls, journal):
+    server, base_url = serve()
+    analyzer = make_analyzer(base_url, cls=cls, journal=journal)
+    if cls is guide.AsyncProjectAnalyzer:
+        async def run():
+            await analyzer.analyze_project()
+            await analyzer.generate_developer_guide()
+        asyncio.run(run())
+    else:
+        analyzer.analyze_project()
+        analyzer.generate_developer_guide()
+
+    findings = json.loads(analyzer.findings_path.read_text(encoding='utf-8'))
+    guide_calls = findings['metrics']['calls']['guide']
+    assert set(title for title, _, _ in guide.GUIDE_SECTIONS) <= set(guide_calls)
+    assert 'guide' in findings['metrics']['totals']['by_kind']
+    assert findings['usage'] == analyzer.usage
+    # Compacted: nothing is left only in the journal
+    assert not analyzer.journal_path.exists()
+
+def test_torn_journal_line_survives_two_resumes(make_analyzer):
+    first = make_analyzer(None, client=object(), journal=True)
+    first._update_findings(('files', 'a.py'), "Resumo a")
+    first.flush_findings()
+    # Crash while writing the next entry
+    with open(first.journal_path, 'a', encoding='utf-8') as f:
+        f.write('{"key": ["files", "b.py"], "val')
+
+    resumed = make_analyzer(None, client=object(), journal=True, resume=first.timestamp)
+    assert set(resumed.findings['files']) == {'a.py'}
+    resumed._update_findings(('files', 'c.py'), "Resumo c")
+    resumed._update_findings(('files', 'd.py'), "Resumo d")
+    resumed.flush_findings()  # Crashes again before compacting
+
+    again = make_analyzer(None, client=object(), journal=True, resume=first.timestamp)
+    assert set(again.findings['files']) == {'a.py', 'c.py', 'd.py'}
+
+def test_call_metrics_are_stored_in_a_stable_order(serve, make_analyzer):
+    server, base_url = serve()
+    analyzer = make_analyzer(base_url, max_workers=4, pack_file_tokens=0)
+    analyzer.analyze_project()
+    # Recorded in completion order: reverse it, as another run could have finished them
+    calls = analyzer.findings['metrics']['calls']
+    analyzer.findings['metrics']['calls'] = {kind: entries if kind == 'root' else dict(reversed(entries.items()))
+                                             for kind, entries in reversed(calls.items())}
+    analyzer._log_metrics()
+    analyzer.flush_findings()
+
+    metrics = json.loads(analyzer.findings_path.read_text(encoding='utf-8'))['metrics']
+    assert list(metrics['calls']) == sorted(metrics['calls'])
+    for kind, entries in metrics['calls'].items():
+        if kind != 'root':
+            assert list(entries) == sorted(entries)
+    assert list(metrics['directories']) == sorted(metrics['directories'])
@@ -0,0 +1,87 @@
+import asyncio
+
+import guide
+
+def test_file_contexts_keep_the_tree_and_a_bounded_set_of_files(make_analyzer):
+    analyzer = make_analyzer(None, client=object())
+    files = {f"src/module_{index:03}.py": f"Resumo {index}" for index in range(200)}
+    files['main.py'] = "Resumo main"
+    files['tests/test_main.py'] = "Resumo test"
+    findings = {'root_summary': "Overview", 'directories': {'.': "Raiz", 'src': "Fontes"}, 'files': files}
+
+    context = analyzer._section_context(findings, 'api')
+
+    assert context[:3] == analyzer._summary_sections(findings)
+    file_sections = [section for section in context if section.startswith('File: ')]
+    assert len(file_sections) == guide.GUIDE_CONTEXT_FILES
+    # Top-level files come first; test files belong to the workflow section
+    assert "File: main.py\nResumo main" in file_sections
+    assert not any('tests/' in section for section in file_sections)
+
+def test_directory_prompt_leaves_out_empty_sections(make_analyzer):
+    analyzer = make_analyzer(None, client=object())
+
+    def details(*args):
+        return analyzer._directory_request('pkg', *args)['messages'][0]['content'][-1]['text']
+
+    assert details(["util.py: Resumo"], []) == "Analise este diretório: pkg\n\nFiles:\nutil.py: Resumo"
+    assert details([], ["sub/: Resumo"]) == "Analise este diretório: pkg\n\nSubdirectories:\nsub/: Resumo"
+    assert details(["a.py: A"], ["sub/: B"]) == ("Analise este diretório: pkg\n\nFiles:\na.py: A\n\n"
+                                                 "Subdirectories:\nsub/: B")
+
+def test_tasks_are_prioritized_by_their_chain_to_the_end_of_the_run(make_analyzer, project, monkeypatch):
+    analyzer = make_analyzer(None, client=object(), max_workers=2)
+    priorities = {}
+    add = guide.TaskGraph.add
+
+    def record(graph, key, func, args=(), deps=(), priority=0, after=()):
+        priorities[key] = priority
+        future = add(graph, key, func, args, deps, priority, after)
+        future.set_result(None)  # Only the priorities matter here
+        return future
+
+    monkeypatch.setattr(guide.TaskGraph, 'add', record)
+    monkeypatch.setattr(guide.TaskGraph, 'start', lambda graph: None)
+    monkeypatch.setattr(analyzer, '_commit_directory', lambda *args: None)
+    analyzer._prepare_incremental_run(analyzer._walk_directories())
+    analyzer._run_task_graph(guide.TaskGraph(None), analyzer._walk_directories(bottom_up=True))
+
+    pkg_chain = priorities[('directory', 'pkg')]
+    root_chain = priorities[('directory', '.')]
+    # The reduce of pkg is followed by the root reduce, so its chain is the longer one
+    assert pkg_chain > root_chain
+    for rel_path in ('pkg/util.py', 'pkg/models.py'):
+        assert priorities[('file', rel_path)] == analyzer._estimate_file_cost(project / rel_path) + pkg_chain
+    # A top-level file only has the root reduce after it: a ready pkg reduce runs first
+    assert priorities[('file', 'README.md')] < pkg_chain
+
+def test_contexts_condensed_together_share_their_digests(make_analyzer, monkeypatch):
+    monkeypatch.setattr(guide, 'GUIDE_INPUT_BUDGET', 3000)
+    analyzer = make_analyzer(None, cls=guide.AsyncProjectAnalyzer, client=object())
+    calls = []
+
+    async def create_message(request, call, on_text=None):
+        calls.append(call)
+        await asyncio.sleep(0.01)
+        return "Resumo"
+
+    analyzer._create_message = create_message
+    sections = [f"File: f{i}.py\n" + 'x = 1\n' * 500 for i in range(6)]
+
+    async def condense_twice():
+        return await asyncio.gather(analyzer._condense(sections), analyzer._condense(sections))
+
+    first, second = asyncio.run(condense_twice())
+    assert first == second
+    assert calls and len(calls) == len(set(calls))
+
+def test_schedule_report_follows_the_whole_dependency_chain():
+    # root -> file -> subdirectory reduce -> parent reduce, run one after the other
+    timings = [('root', 0.0, 1.0), (('file', 'pkg/sub/a.py'), 1.0, 11.0),
+               (('directory', 'pkg/sub'), 11.0, 21.0), (('directory', 'pkg'), 21.0, 31.0)]
+    chains = {('file', 'pkg/sub/a.py'): ['root'], ('directory', 'pkg/sub'): [('file', 'pkg/sub/a.py')],
+              ('directory', 'pkg'): [('directory', 'pkg/sub')]}
+    report = guide.schedule_report(timings, 4, chains)
+    assert report['critical_path_seconds'] == 31.0
+    assert report['lower_bound_seconds'] == 31.0
+    assert report['makespan_over_lower_bound'] == 1.0
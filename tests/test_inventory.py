@@ -0,0 +1,34 @@
+import os
+
+import guide
+from conftest import PROJECT_FILES
+
+def test_unreadable_file_is_left_out(project, monkeypatch):
+    hash_file = guide.Inventory._hash_file
+
+    def deleted_mid_scan(entry):
+        if entry.name == 'util.py':
+            raise FileNotFoundError(2, "No such file or directory", entry.path)
+        return hash_file(entry)
+
+    monkeypatch.setattr(guide.Inventory, '_hash_file', staticmethod(deleted_mid_scan))
+    inventory = guide.Inventory.build(project, lambda rel_path: False)
+
+    assert 'pkg/util.py' not in inventory.entries
+    assert inventory.directories['pkg']['files'] == ['pkg/__init__.py', 'pkg/models.py']
+    assert len(inventory.entries) == len(PROJECT_FILES) - 1 + 2  # files and the two directories
+
+def test_unreadable_directory_is_left_out(project, monkeypatch):
+    stat = os.stat
+
+    def unreadable(path, *args, **kwargs):
+        if str(path).endswith('pkg'):
+            raise PermissionError(13, "Permission denied", str(path))
+        return stat(path, *args, **kwargs)
+
+    monkeypatch.setattr(guide.os, 'stat', unreadable)
+    inventory = guide.Inventory.build(project, lambda rel_path: False)
+
+    assert set(inventory.directories) == {'.'}
+    assert inventory.directories['.']['subdirs'] == []
+    assert not any(rel_path.startswith('pkg') for rel_path in inventory.entries)
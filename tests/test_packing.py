@@ -0,0 +1,90 @@
+import asyncio
+
+import pytest
+
+import guide
+from conftest import PROJECT_FILES
+
+def run(analyzer):
+    if isinstance(analyzer, guide.AsyncProjectAnalyzer):
+        asyncio.run(analyzer.analyze_project())
+    else:
+        analyzer.analyze_project()
+
+@pytest.mark.parametrize('cls', [guide.ProjectAnalyzer, guide.AsyncProjectAnalyzer])
+def test_small_files_share_one_request(serve, make_analyzer, monkeypatch, cls):
+    server, base_url = serve()
+    analyzer = make_analyzer(base_url, cls=cls, max_workers=2)
+    reads = []
+    read_file = analyzer._read_file
+    monkeypatch.setattr(analyzer, '_read_file', lambda path: reads.append(path) or read_file(path))
+    run(analyzer)
+
+    calls = analyzer.findings['metrics']['calls']
+    (pack,) = calls['packs'].values()
+    assert sorted(pack['files']) == sorted(PROJECT_FILES)
+    assert 'files' not in calls
+    # Root overview, the pack and two directories
+    assert server.fake.snapshot()['messages'] == 4
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+    # Every file is read once, by the plan, and the plan does not count as cache misses
+    assert len(reads) == len(PROJECT_FILES)
+    assert analyzer.cache.stats()['misses'] == 0
+
+def test_files_missing_from_a_cut_off_reply_get_their_own_request(serve, make_analyzer):
+    # Five summaries of 3000 tokens cannot fit in MAX_TOKENS: the reply is cut off
+    server, base_url = serve(output_tokens=3000)
+    analyzer = make_analyzer(base_url)
+    analyzer.analyze_project()
+
+    calls = analyzer.findings['metrics']['calls']
+    assert len(calls['packs']) == 1
+    assert 0 < len(calls['files']) < len(PROJECT_FILES)
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES)
+
+def add_large_file(project):
+    # Well above PACK_FILE_MAX_TOKENS, so it is summarized on its own
+    (project / 'pkg' / 'big.py').write_text('x = 1\n' * 5000, encoding='utf-8')
+
+def test_packs_are_graph_tasks_scheduled_by_cost(make_analyzer, project, monkeypatch):
+    add_large_file(project)
+    analyzer = make_analyzer(None, client=object(), max_workers=2)
+    added = {}
+    add = guide.TaskGraph.add
+
+    def record(graph, key, func, args=(), deps=(), priority=0, after=()):
+        added[key] = (priority, list(after))
+        future = add(graph, key, func, args, deps, priority, after)
+        future.set_result(None)  # Only the graph matters here
+        return future
+
+    monkeypatch.setattr(guide.TaskGraph, 'add', record)
+    monkeypatch.setattr(guide.TaskGraph, 'start', lambda graph: None)
+    monkeypatch.setattr(analyzer, '_commit_directory', lambda *args: None)
+    analyzer._prepare_incremental_run(analyzer._walk_directories())
+    analyzer._run_task_graph(guide.TaskGraph(None), analyzer._walk_directories(bottom_up=True))
+
+    (pack,) = [key for key in added if key[0] == 'pack']
+    assert added[pack][1] == ['root']
+    for rel_path in PROJECT_FILES:
+        assert added[('file', rel_path)][1] == ['root', pack]
+    assert added[('file', 'pkg/big.py')][1] == ['root']
+    # Longest processing time first: the large file is picked before the pack
+    assert added[('file', 'pkg/big.py')][0] > added[pack][0]
+
+def test_async_pipeline_queues_large_files_before_packs(serve, make_analyzer, project):
+    add_large_file(project)
+    server, base_url = serve()
+    analyzer = make_analyzer(base_url, cls=guide.AsyncProjectAnalyzer, max_workers=1)
+    calls = []
+    create_message = analyzer._create_message
+
+    async def record(request, call, on_text=None):
+        calls.append(call[0])
+        return await create_message(request, call, on_text)
+
+    analyzer._create_message = record
+    asyncio.run(analyzer.analyze_project())
+
+    assert calls[:3] == ['root', 'files', 'packs']
+    assert set(analyzer.findings['files']) == set(PROJECT_FILES) | {'pkg/big.py'}
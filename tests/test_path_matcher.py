@@ -0,0 +1,50 @@
+import pytest
+
+import guide
+
+@pytest.mark.parametrize('patterns, rel_path, excluded', [
+    # Plain names match whole components only
+    (['data'], 'metadata.py', False),
+    (['data'], 'pkg/metadata.py', False),
+    (['data'], 'data/users.csv', True),
+    (['data'], 'pkg/data', True),
+    # Globs without a slash match any component
+    (['*.min.js'], 'static/app.min.js', True),
+    (['*.min.js'], 'static/app.js', False),
+    # Globs with a slash are anchored at the project root
+    (['docs/build'], 'docs/build/index.html', True),
+    (['docs/build'], 'src/docs/build/index.html', False),
+    (['/docs/build/'], 'docs/build', True),
+    # '*' and '?' stay within one component
+    (['docs/*.md'], 'docs/intro.md', True),
+    (['docs/*.md'], 'docs/api/intro.md', False),
+    (['src/?.py'], 'src/a.py', True),
+    (['src/?.py'], 'src/a/b.py', False),
+    (['src/[ab].py'], 'src/b.py', True),
+    (['src/[!ab].py'], 'src/b.py', False),
+    # '**/' matches zero or more directories, and a leading one matches at any depth
+    (['**/fixtures'], 'fixtures/users.json', True),
+    (['**/fixtures'], 'tests/unit/fixtures/users.json', True),
+    (['**/fixtures'], 'tests/myfixtures/users.json', False),
+    (['src/**/generated'], 'src/generated/api.py', True),
+    (['src/**/generated'], 'src/a/b/generated/api.py', True),
+    (['src/**/generated'], 'lib/src/generated/api.py', False),
+    # A trailing '/**' matches everything inside
+    (['build/**'], 'build/lib/module.py', True),
+    (['build/**'], 'src/build/module.py', False),
+])
+def test_patterns_follow_gitignore_syntax(patterns, rel_path, excluded):
+    assert guide.PathMatcher(patterns).matches(rel_path) is excluded
+
+def test_comments_blank_lines_and_negations_are_ignored():
+    matcher = guide.PathMatcher(['# data', '', '!keep.txt', 'logs/'])
+    assert not matcher.matches('data/users.csv')
+    assert not matcher.matches('keep.txt')
+    assert matcher.matches('logs/app.log')
+
+def test_metadata_module_is_not_excluded_by_the_default_list(make_analyzer, project):
+    (project / 'pkg' / 'metadata.py').write_text("VERSION = '1.0'\n", encoding='utf-8')
+    analyzer = make_analyzer(None, client=object())
+    assert 'data' in guide.EXCLUSION_LIST
+    assert not analyzer.is_excluded(project / 'pkg' / 'metadata.py')
+    assert analyzer.is_excluded(project / 'data' / 'users.csv')
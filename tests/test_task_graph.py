@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+import guide
+
+TIMEOUT = 5
+
+def blocked_pool(workers=1):
+    """Pool whose workers are all busy until the returned event is set"""
+    pool = guide.PriorityPool(workers)
+    gate = threading.Event()
+    for _ in range(workers):
+        pool.submit(float('inf'), 'gate', gate.wait, TIMEOUT)
+    return pool, gate
+
+def test_pool_runs_the_highest_priority_first():
+    order = []
+    pool, gate = blocked_pool()
+    with pool:
+        for priority in (1, 3, 2, 3):
+            pool.submit(priority, priority, order.append, priority)
+        gate.set()
+    # Ties run in submission order
+    assert order == [3, 3, 2, 1]
+    assert [label for label, _, _ in pool.timings] == ['gate', 3, 3, 2, 1]
+
+def test_tasks_get_the_results_of_their_dependencies_in_order():
+    calls = []
+
+    def record(name, *results):
+        calls.append(name)
+        return f"{name}({', '.join(results)})"
+
+    with guide.PriorityPool(2) as pool:
+        graph = guide.TaskGraph(pool)
+        graph.add('root', record, args=('root',))
+        graph.add('a', record, args=('a',), after=['root'])
+        graph.done('b', 'b()')
+        reduce = graph.add('reduce', record, args=('reduce',), deps=['a', 'b'])
+        graph.start()
+        # Results of `after` tasks are not passed; done() tasks are not run
+        assert reduce.result(timeout=TIMEOUT) == 'reduce(a(), b())'
+    assert calls == ['root', 'a', 'reduce']
+    assert graph.chains() == {'a': ['root'], 'reduce': ['a', 'b']}
+
+def test_a_failed_dependency_contributes_none():
+    def fail():
+        raise ValueError("boom")
+
+    with guide.PriorityPool(2) as pool:
+        graph = guide.TaskGraph(pool)
+        failed = graph.add('fail', fail)
+        graph.add('ok', lambda: 'ok')
+        reduce = graph.add('reduce', lambda *results: results, deps=['fail', 'ok'])
+        graph.start()
+        assert reduce.result(timeout=TIMEOUT) == (None, 'ok')
+        with pytest.raises(ValueError):
+            failed.result(timeout=TIMEOUT)
+
+def test_a_cancelled_task_cancels_its_dependents():
+    ran = []
+    pool, gate = blocked_pool()
+    with pool:
+        graph = guide.TaskGraph(pool)
+        leaf = graph.add('leaf', ran.append, args=('leaf',))
+        middle = graph.add('middle', ran.append, args=('middle',), deps=['leaf'])
+        top = graph.add('top', ran.append, args=('top',), deps=['middle'])
+        graph.start()
+        leaf.cancel()
+        gate.set()
+    assert middle.cancelled() and top.cancelled()
+    assert 'middle' not in ran and 'top' not in ran
+
+def test_cancel_drops_every_task_that_has_not_started():
+    ran = []
+    pool, gate = blocked_pool()
+    with pool:
+        graph = guide.TaskGraph(pool)
+        futures = [graph.add('leaf', ran.append, args=('leaf',)),
+                   graph.add('reduce', ran.append, args=('reduce',), deps=['leaf'])]
+        graph.start()
+        graph.cancel()
+        gate.set()
+    assert all(future.cancelled() for future in futures)
+    assert ran == []